@@ -1,9 +1,12 @@
 #!/usr/bin/env python
 # -*- coding: utf8 -*-
 
+import codecs
+import itertools
 import os
 import re
 import sys
+import time
 
 class ParseException(Exception):
 	def __init__(self, filename, lineno, *args):
@@ -11,36 +14,252 @@ class ParseException(Exception):
 		self.filename = filename
 		self.lineno = lineno
 
+class SkipFile(Exception):
+	"""Raised by a parser that finds, part way through, it has no use for the rest of the file."""
+	pass
+
+class LazyRegex(object):
+	"""A regular expression compiled the first time it's used, rather than when it's defined.
+
+	Most of the grammar's expressions are large, and scripts that only need a few of them shouldn't
+	pay to compile the rest at import.
+	"""
+
+	METHODS = [ "match", "search", "split", "sub", "subn", "findall", "finditer" ]
+
+	def __init__(self, pattern, flags=0):
+		self.pattern = pattern
+		self.flags = flags
+
+	def __getattr__(self, name):
+		# Only called for attributes not already set, so after the first use the compiled
+		# expression's methods are found directly.
+		regex = re.compile(self.pattern, self.flags)
+		for method in self.METHODS:
+			setattr(self, method, getattr(regex, method))
+		self.groups = regex.groups
+		self.groupindex = regex.groupindex
+
+		return getattr(regex, name)
+
+def lazy_compile(pattern, flags=0):
+	return LazyRegex(pattern, flags)
+
+class LintRule(object):
+	"""A check_line rule: strings, or a pattern, that must not appear anywhere in a line.
+
+	verify, if given, is called with the line when the rule matches and decides whether it really
+	fires; use it for checks that a pattern alone can't express.
+	"""
+
+	def __init__(self, message, strings=(), pattern=None, verify=None):
+		self.message = message
+		self.strings = list(strings)
+		self.pattern = pattern
+		self.verify = verify
+
+		self.regex = None
+		if pattern is not None:
+			self.regex = lazy_compile(pattern)
+
+	def fires(self, line):
+		for string in self.strings:
+			if string in line:
+				break
+		else:
+			if self.regex is None or self.regex.search(line) is None:
+				return False
+
+		return self.verify is None or self.verify(line)
+
+def trie_expr(strings):
+	"""Return a regular expression matching any of strings, factored on common prefixes.
+
+	The re module tries each branch of an alternation in turn at every position, so sharing prefixes
+	makes a large set of literals much cheaper to search for than joining them with |.
+	"""
+	trie = {}
+	for string in strings:
+		node = trie
+		for char in string:
+			node = node.setdefault(char, {})
+		node[""] = None
+
+	def node_expr(node):
+		# Once any string has matched, longer ones sharing its prefix don't matter.
+		if "" in node:
+			return ""
+
+		branches = [ re.escape(char) + node_expr(node[char]) for char in sorted(node.keys()) ]
+		if len(branches) == 1:
+			return branches[0]
+		return "(?:" + "|".join(branches) + ")"
+
+	return node_expr(trie)
+
+class Linter(object):
+	"""Checks a line against a list of LintRules in a single scan.
+
+	Every rule's strings and patterns are compiled into one regular expression, so a clean line costs
+	one search no matter how many rules there are. Only when that finds something are the rules tried
+	one at a time, in order, so the rule reported is the one checking them separately would report.
+	"""
+
+	def __init__(self, rules):
+		self.rules = rules
+
+		strings = [ string for rule in rules for string in rule.strings ]
+		exprs = [ trie_expr(strings) ] if len(strings) else []
+		exprs.extend("(?:%s)" % rule.pattern for rule in rules if rule.pattern is not None)
+		self.regex = re.compile("|".join(exprs))
+
+	def check(self, line):
+		if self.regex.search(line) is None:
+			return None
+
+		for rule in self.rules:
+			if rule.fires(line):
+				return rule
+
+		return None
+
+class LabelBlock(object):
+	"""A block of "Label value" lines, declared once per parser class.
+
+	labels is a list of (label, handler method name) pairs. Rather than trying every label against
+	each line, the line is split at each of its first few spaces and the part before looked up
+	directly. If all is True, every label must appear in the block.
+	"""
+
+	def __init__(self, labels, all=False):
+		self.handlers = dict(labels)
+		self.max_words = max(label.count(" ") + 1 for label in self.handlers.keys())
+		self.required = set(self.handlers.keys()) if all else set()
+
+	def match(self, line):
+		"""Return (label, value) for line, or None if it doesn't begin with one of the labels."""
+		end = -1
+		for words in range(self.max_words):
+			end = line.find(" ", end + 1)
+			if end < 0:
+				break
+
+			label = line[:end]
+			if label in self.handlers:
+				return (label, line[end + 1:])
+
+		return None
+
+class Profile(object):
+	"""Call counts and timings of the handle_* methods and check_line of parsers.
+
+	Set Parser.profile to an instance to have every parser created after that instrumented; with it left
+	as None parsers are untouched and nothing is timed.
+	"""
+
+	def __init__(self):
+		self.stats = {}
+
+	def instrument(self, parser):
+		for name in dir(parser):
+			if name.startswith("handle_") or name == "check_line":
+				setattr(parser, name, self.timed(parser, name, getattr(parser, name)))
+
+	def timed(self, parser, name, method):
+		key = "%s.%s" % (type(parser).__name__, name)
+		if key not in self.stats:
+			self.stats[key] = { "calls": 0, "total": 0.0, "max": 0.0, "slowest": None }
+		stats = self.stats[key]
+
+		def timed_method(*args):
+			start = time.time()
+			try:
+				return method(*args)
+			finally:
+				elapsed = time.time() - start
+				stats["calls"] += 1
+				stats["total"] += elapsed
+				if stats["slowest"] is None or elapsed > stats["max"]:
+					stats["max"] = elapsed
+					stats["slowest"] = "%s:%d" % (parser.filename, parser.lineno)
+		return timed_method
+
+	def report(self, file):
+		"""Print a table of the handlers that were called, slowest in total first."""
+		print >>file, "%-50s %8s %12s %10s  %s" % ("handler", "calls", "total (ms)", "max (ms)", "slowest")
+		for key, stats in sorted(self.stats.items(), key=lambda item: -item[1]["total"]):
+			if not stats["calls"]:
+				continue
+			print >>file, "%-50s %8d %12.2f %10.3f  %s" % (
+				key, stats["calls"], stats["total"] * 1000, stats["max"] * 1000, stats["slowest"])
+
 class Parser(object):
-	def __init__(self, filename):
+	# Map the file rather than reading it, saving a copy of the raw bytes for large files.
+	use_mmap = False
+
+	# Profile to record handler timings in, see Profile.
+	profile = None
+
+	def __init__(self, filename, lines=None):
+		"""Parser for filename, reading it unless the decoded lines are given.
+
+		A parser filled from a Record has no need of the file, and is given no lines.
+		"""
 		self.filename = filename
-		self.file = None
-		self.file = open(filename)
 		self.lineno = 0
+		self.lines = lines if lines is not None else self.read_lines()
 
-	def __del__(self):
-		if self.file is not None:
-			self.close()
+		if self.profile is not None:
+			self.profile.instrument(self)
 
 	def close(self):
-		self.file.close()
-		self.file = None
+		self.lines = None
 
 	def error(self, *args):
+		# Messages often quote the decoded line, keep them as UTF-8 like the source files.
+		args = [ arg.encode('utf8') if isinstance(arg, unicode) else arg for arg in args ]
 		return ParseException(self.filename, self.lineno, *args)
 
+	def read_lines(self):
+		with open(self.filename, 'rb') as f:
+			if self.use_mmap and os.fstat(f.fileno()).st_size > 0:
+				# Imported here so parsers that don't map files don't pay for loading it.
+				import mmap
+				data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+			else:
+				data = f.read()
+
+		try:
+			try:
+				(text, length) = codecs.utf_8_decode(data, 'strict', True)
+			except UnicodeDecodeError, e:
+				self.lineno = data[:e.start].count("\n") + 1
+				raise self.error("Invalid UTF-8: %s" % e.reason)
+		finally:
+			if not isinstance(data, str):
+				data.close()
+
+		lines = [ line.rstrip(u"\r") for line in text.split(u"\n") ]
+		# A final newline terminates the last line rather than starting a new one.
+		if lines[-1] == u"":
+			lines.pop()
+
+		return lines
+
 	def next_line(self, error_message=None):
-		line = self.file.readline()
-		if len(line):
+		while self.lineno < len(self.lines):
+			line = self.lines[self.lineno]
 			self.lineno += 1
-			line = line.rstrip("\r\n")
+
 			# Any line beginning with // can be ignored as a comment.
-			if line.startswith("//"):
-				return self.next_line(error_message=error_message)
+			if line.startswith(u"//"):
+				continue
+
 			self.check_line(line)
 			return line
-		elif error_message is not None:
-			raise self.error(error)
+
+		if error_message is not None:
+			raise self.error(error_message)
 		else:
 			return None
 
@@ -80,63 +299,148 @@ class Parser(object):
 
 		return lines
 
+	lint_rules = [
+		LintRule("Double space", strings=[ "  " ]),
+		LintRule("Bad space marker", strings=[ u"·" ]),
+		LintRule("Space before comma", strings=[ " ," ]),
+		LintRule("Space before period", strings=[ " ." ]),
+		LintRule("Bad quote character", strings=[ u"’", u"“", u"”" ]),
+		LintRule("Spotted o f, ofthe, ofit, or ofa", strings=[ " o f ", "ofthe", "ofit", "ofa" ]),
+		LintRule("Spotted missing ff", strings=[ " ect", "o er " ]),
+		LintRule("Spotted missing ffi", strings=[ "di ", " c " ]),
+		LintRule("Spotted missing fi", strings=[ "igni ", " ist ", " re " ]),
+		LintRule("Spotted missing fl", strings=[ " y ", " ies ", " uage" ]),
+		LintRule("Spotted missing ffi", strings=[ "i cult" ]),
+		LintRule("Spotted dash that should be en-dash", pattern=r'[0-9]-[0-9]'),
+		LintRule("Suspicious number-like form", pattern=r'r[0-9][lIJSO]|[lIJSO][0-9]|[lJSO][JSO]+|[lI]d[0-9]'),
+	]
+
+	@classmethod
+	def linter(cls):
+		# Compiled on first use, and separately for each class since subclasses may add rules.
+		if "_linter" not in cls.__dict__:
+			cls._linter = Linter(cls.lint_rules)
+		return cls._linter
+
 	def check_line(self, line):
-		if "  " in line:
-			raise self.error("Double space: %s" % line)
-		if "·" in line:
-			raise self.error("Bad space marker: %s" % line)
-		if " ," in line:
-			raise self.error("Space before comma: %s" % line)
-		if " ." in line:
-			raise self.error("Space before period: %s" % line)
-		if "’" in line or "“" in line or "”" in line:
-			raise self.error("Bad quote character: %s" % line)
-		if " o f " in line or "ofthe" in line or "ofit" in line or "ofa" in line:
-			raise self.error("Spotted o f, ofthe, ofit, or ofa: %s" % line)
-		if " ect" in line or "o er " in line:
-			raise self.error("Spotted missing ff: %s" % line)
-		if "di " in line or " c " in line:
-			raise self.error("Spotted missing ffi: %s" % line)
-		if "igni " in line or " ist " in line or " re " in line:
-			raise self.error("Spotted missing fi: %s" % line)
-		if " y " in line or " ies " in line or " uage" in line:
-			raise self.error("Spotted missing fl: %s" % line)
-		if "i cult" in line:
-			raise self.error("Spotted missing ffi: %s" % line)
-
-		if re.search(r'[0-9]-[0-9]', line):
-			raise self.error("Spotted dash that should be en-dash: %s" % line)
-		if re.search('r[0-9][lIJSO]|[lIJSO][0-9]|[lJSO][JSO]+|[lI]d[0-9]', line):
-			raise self.error("Suspicious number-like form: %s" % line)
-
-	def label_block(self, lines, all=False):
+		rule = self.linter().check(line)
+		if rule is not None:
+			raise self.error("%s: %s" % (rule.message, line))
+
+	def label_block(self, block):
+		seen = set()
 		while True:
 			line = self.next_line()
 			if line is None or len(line) == 0:
 				break
 
-			for (prefix, handler) in lines.items():
-				if line.startswith(prefix + " "):
-					handler(line[len(prefix) + 1:])
-					del lines[prefix]
-					break
-			else:
-				raise self.error("Expected one of %s" % ", ".join(sorted(lines.keys())))
+			match = block.match(line)
+			if match is None or match[0] in seen:
+				remaining = set(block.handlers.keys()) - seen
+				raise self.error("Expected one of %s" % ", ".join(sorted(remaining)))
+
+			(label, value) = match
+			seen.add(label)
+			getattr(self, block.handlers[label])(value)
+
+		missing = block.required - seen
+		if len(missing):
+			raise self.error("Expected each of %s in block" % ", ".join(sorted(missing)))
+
+
+class Record(object):
+	"""The handler calls made by one parse of a file.
+
+	Replaying it into other parsers fills them as if they'd parsed the file themselves, so one parse can
+	produce any number of outputs. Records can be pickled, to send back from worker processes.
+	"""
+
+	def __init__(self, filename):
+		self.filename = filename
+		self.calls = []
+
+	def replay(self, parser):
+		for lineno, name, args in self.calls:
+			# So errors raised by the handler report the line it came from.
+			parser.lineno = lineno
+			getattr(parser, name)(*args)
+
+class Recorder(object):
+	"""Mixin for parsers that records each handler call in self.record, rather than acting on it.
+
+	The grammar and lint checks still run, once, as the file is parsed.
+	"""
+
+	def __init__(self, *args, **kwargs):
+		super(Recorder, self).__init__(*args, **kwargs)
+		self.record = Record(self.filename)
+
+		for name in dir(self):
+			if name.startswith("handle_"):
+				setattr(self, name, self.recording_handler(name))
+
+	def recording_handler(self, name):
+		def recording_handler(*args):
+			self.record.calls.append((self.lineno, name, args))
+		return recording_handler
+
+
+class Struct(object):
+	"""A compact record of parsed data, keeping its fields in __slots__ rather than a dictionary of its own.
+
+	Fields are named for the keys they're exported as, and the constructor takes them in order or by
+	name, leaving the rest None. Lists are kept as tuples, and object() converts the whole record to the
+	dictionaries and lists that are exported, leaving out the fields that are None.
+	"""
+
+	__slots__ = ()
+
+	def __init__(self, *args, **kwargs):
+		for name, value in itertools.izip_longest(self.__slots__, args):
+			setattr(self, name, value)
+		for name, value in kwargs.iteritems():
+			setattr(self, name, value)
+
+	def __getstate__(self):
+		return tuple(getattr(self, name) for name in self.__slots__)
+
+	def __setstate__(self, state):
+		for name, value in itertools.izip(self.__slots__, state):
+			setattr(self, name, value)
+
+	def object(self):
+		object = {}
+		for name in self.__slots__:
+			value = getattr(self, name)
+			if value is not None:
+				object[name] = exported_value(value)
+		return object
+
+def exported_value(value):
+	if isinstance(value, Struct):
+		return value.object()
+	elif isinstance(value, tuple):
+		return [ exported_value(item) for item in value ]
+	else:
+		return value
 
-		if len(lines) and all:
-			raise self.error("Expected each of %s in block" % ", ".join(sorted(lines.keys())))
+class Source(Struct):
+	__slots__ = ("book", "page", "section")
 
 
-def local_files(file_type):
-	files = sys.argv[1:]
+def local_files(file_type, files=None):
+	if files is None:
+		files = sys.argv[1:]
+	files = list(files)
 	if not len(files):
+		# Sorted, so the export is in the same order whatever order the directories list in.
 		basedir = os.path.join(os.path.dirname(sys.argv[0]), file_type)
-		for subdir in os.listdir(basedir):
+		for subdir in sorted(os.listdir(basedir)):
 			subdir = os.path.join(basedir, subdir)
 			if not os.path.isdir(subdir):
 				continue
 
-			filenames = [ os.path.join(subdir, filename) for filename in os.listdir(subdir) ]
+			filenames = [ os.path.join(subdir, filename) for filename in sorted(os.listdir(subdir)) ]
 			files += filenames
 
 	return files
@@ -0,0 +1,292 @@
+#!/usr/bin/env python
+# -*- coding: utf8 -*-
+
+import argparse
+import json
+import os
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+import corpus
+
+IMPORT_MODULES = [ "monster", "spell", "m2fc", "export" ]
+STAGES = [ "parse", "export", "m2fc", "catalog" ]
+
+def time_import(module, runs):
+	"""Time importing module in fresh interpreters, since a second import in the same one is free."""
+	script = "import time; start = time.time(); import %s; print repr(time.time() - start)" % module
+	basedir = os.path.dirname(os.path.abspath(__file__))
+
+	times = []
+	for run in range(runs):
+		output = subprocess.check_output([ sys.executable, "-c", script ], cwd=basedir)
+		times.append(float(output))
+
+	times.sort()
+	return {
+		"min": times[0],
+		"median": times[len(times) // 2],
+	}
+
+def benchmark_imports(runs):
+	# Run once first so every module has an up-to-date .pyc, and compiling it isn't measured.
+	for module in IMPORT_MODULES:
+		time_import(module, 1)
+
+	return dict((module, time_import(module, runs)) for module in IMPORT_MODULES)
+
+
+def corpus_files(path, file_type):
+	basedir = os.path.join(path, file_type)
+	filenames = []
+	for subdir in sorted(os.listdir(basedir)):
+		subdir = os.path.join(basedir, subdir)
+		filenames += [ os.path.join(subdir, filename) for filename in sorted(os.listdir(subdir)) ]
+	return filenames
+
+def count_lines(filenames):
+	lines = 0
+	for filename in filenames:
+		with open(filename, 'rb') as f:
+			lines += f.read().count("\n")
+	return lines
+
+def parse_stage(monster_files, spell_files):
+	import monster
+	import spell
+
+	for parser_class, filenames in ((monster.MonsterParser, monster_files), (spell.SpellParser, spell_files)):
+		for filename in filenames:
+			parser = parser_class(filename)
+			try:
+				parser.parse()
+			finally:
+				parser.close()
+
+def export_stage(monster_files, spell_files):
+	import export
+	import monster
+	import spell
+
+	with open(os.devnull, 'wb') as output:
+		writer = export.ExportWriter(output)
+		writer.begin()
+		writer.write_item("books", export.BOOKS)
+		for key, parser_class, filenames in (("monsters", monster.MonsterExporter, monster_files),
+											 ("spells", spell.SpellExporter, spell_files)):
+			writer.write_array(key, export.export_files(parser_class, filenames, export.BOOK_TAGS))
+		writer.write_item("version", 0)
+		writer.end()
+
+def m2fc_stage(monster_files, spell_files):
+	import m2fc
+
+	monsters = m2fc.MonsterSorter(10000)
+	try:
+		for filename in monster_files:
+			parser = m2fc.FightClubConverter(filename)
+			try:
+				parser.parse()
+				monsters.add(parser.name, parser.xml().encode('utf8'))
+			finally:
+				parser.close()
+
+		with open(os.devnull, 'wb') as output:
+			for name, xml in monsters:
+				output.write(xml)
+	finally:
+		monsters.close()
+
+def object_size(value, seen):
+	"""Return the bytes taken by value and everything it refers to, not counting objects already seen."""
+	if id(value) in seen:
+		return 0
+	seen.add(id(value))
+
+	size = sys.getsizeof(value)
+	if isinstance(value, dict):
+		for key, item in value.iteritems():
+			size += object_size(key, seen) + object_size(item, seen)
+	elif isinstance(value, (list, tuple)):
+		for item in value:
+			size += object_size(item, seen)
+	else:
+		for name in getattr(type(value), "__slots__", ()):
+			size += object_size(getattr(value, name, None), seen)
+	return size
+
+def record_sizes(path):
+	"""Return the average bytes kept in memory for each monster and spell of the corpus at path.
+
+	Each is measured both as the __slots__ record its exporter returns and as the dictionary object()
+	expands that to, so the two can be compared from the same run.
+	"""
+	import base
+	import export
+	import monster
+	import spell
+
+	def average_size(values):
+		# None, the booleans and small ints are shared with the rest of the process, so don't count them.
+		seen = set(id(value) for value in [ None, True, False ] + range(-5, 257))
+		return object_size(values, seen) / len(values)
+
+	sizes = {}
+	for key, parser_class, file_type in (("monster", monster.MonsterExporter, "Monsters"),
+										 ("spell", spell.SpellExporter, "Spells")):
+		records = []
+		for filename in corpus_files(path, file_type):
+			try:
+				parser = parser_class(filename, bookTags=export.BOOK_TAGS)
+				try:
+					parser.parse()
+					records.append(parser.export())
+				finally:
+					parser.close()
+			except (base.SkipFile, base.ParseException):
+				continue
+
+		objects = [ record.object() for record in records ]
+		sizes[key] = { "slots": average_size(records), "dict": average_size(objects) }
+	return sizes
+
+def catalog_stage(monster_files, spell_files):
+	import catalog
+	import monster
+	import spell
+
+	for scanner_class, filenames in ((monster.MonsterScanner, monster_files), (spell.SpellScanner, spell_files)):
+		for entry in catalog.scan_files(scanner_class, filenames):
+			entry.object()
+
+def run_stage(stage, path):
+	"""Run one stage over the corpus at path, returning its throughput and the peak memory of the process.
+
+	Each stage is run in a fresh interpreter, so the peak memory is its own and not left over from another.
+	"""
+	monster_files = corpus_files(path, "Monsters")
+	spell_files = corpus_files(path, "Spells")
+	if stage == "m2fc":
+		spell_files = []
+
+	files = len(monster_files) + len(spell_files)
+	lines = count_lines(monster_files) + count_lines(spell_files)
+
+	stage_function = globals()[stage + "_stage"]
+	start = time.time()
+	stage_function(monster_files, spell_files)
+	seconds = time.time() - start
+
+	return {
+		"files": files,
+		"lines": lines,
+		"seconds": seconds,
+		"files_per_second": files / seconds,
+		"lines_per_second": lines / seconds,
+		# Linux reports this in kilobytes.
+		"peak_memory": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024,
+	}
+
+def time_stage(stage, path):
+	script = "import benchmark, json; print json.dumps(benchmark.run_stage(%r, %r))" % (stage, path)
+	basedir = os.path.dirname(os.path.abspath(__file__))
+
+	output = subprocess.check_output([ sys.executable, "-c", script ], cwd=basedir)
+	return json.loads(output)
+
+def benchmark_stages(sizes, corpus_dir=None):
+	results = {}
+	for size in sizes:
+		if corpus_dir is not None:
+			# Generated corpora are kept between runs, since the larger ones take a while to write.
+			path = os.path.join(corpus_dir, str(size))
+			if not os.path.isdir(path):
+				corpus.generate(path, size)
+		else:
+			path = tempfile.mkdtemp()
+			corpus.generate(path, size)
+
+		try:
+			results[str(size)] = dict((stage, time_stage(stage, path)) for stage in STAGES)
+			results[str(size)]["memory"] = record_sizes(path)
+		finally:
+			if corpus_dir is None:
+				shutil.rmtree(path)
+
+	return results
+
+def change(value, baseline):
+	if not baseline:
+		return ""
+	return "%+.1f%%" % ((value - baseline) * 100.0 / baseline)
+
+def main():
+	argparser = argparse.ArgumentParser(description="Benchmark the monster and spell tools.")
+	argparser.add_argument("-n", "--runs", type=int, default=20,
+						   help="number of times to repeat each measurement")
+	argparser.add_argument("-o", "--output", metavar="PATH",
+						   help="file to save the results to, as JSON")
+	argparser.add_argument("-b", "--baseline", metavar="PATH",
+						   help="results saved by an earlier run to compare against")
+	argparser.add_argument("-s", "--sizes", default="1000",
+						   help="comma-separated numbers of monsters and spells to benchmark the stages with, "
+						   "such as 1000,10000,100000")
+	argparser.add_argument("--corpus", metavar="DIR",
+						   help="directory to keep generated corpora in, instead of regenerating them each run")
+	options = argparser.parse_args()
+
+	sizes = [ int(size) for size in options.sizes.split(",") if size ]
+
+	results = {
+		"imports": benchmark_imports(options.runs),
+		"stages": benchmark_stages(sizes, options.corpus),
+	}
+
+	baseline = { "imports": {}, "stages": {} }
+	if options.baseline is not None:
+		with open(options.baseline) as f:
+			baseline = json.load(f)
+
+	print "%-10s %10s %10s %10s" % ("import", "min (ms)", "median (ms)", "change")
+	for module in IMPORT_MODULES:
+		timing = results["imports"][module]
+		baseline_timing = baseline["imports"].get(module, {})
+		print "%-10s %10.2f %10.2f %10s" % (module, timing["min"] * 1000, timing["median"] * 1000,
+											change(timing["median"], baseline_timing.get("median")))
+
+	print
+	print "%-8s %-8s %10s %12s %10s %10s %10s" % (
+		"records", "stage", "files/s", "lines/s", "change", "peak (MB)", "change")
+	for size in sizes:
+		for stage in STAGES:
+			timing = results["stages"][str(size)][stage]
+			baseline_timing = baseline["stages"].get(str(size), {}).get(stage, {})
+			print "%-8d %-8s %10.0f %12.0f %10s %10.1f %10s" % (
+				size, stage, timing["files_per_second"], timing["lines_per_second"],
+				change(timing["lines_per_second"], baseline_timing.get("lines_per_second")),
+				timing["peak_memory"] / 1048576.0,
+				change(timing["peak_memory"], baseline_timing.get("peak_memory")))
+
+	print
+	# Bytes per record, as kept in __slots__ records and as the dictionaries they're written from.
+	print "%-8s %-8s %12s %12s %10s %10s" % ("records", "type", "slots (B)", "dict (B)", "saved", "change")
+	for size in sizes:
+		memory = results["stages"][str(size)]["memory"]
+		baseline_memory = baseline["stages"].get(str(size), {}).get("memory", {})
+		for key in ("monster", "spell"):
+			slots = memory[key]["slots"]
+			dict_size = memory[key]["dict"]
+			print "%-8d %-8s %12d %12d %10s %10s" % (size, key, slots, dict_size, change(slots, dict_size),
+													 change(slots, baseline_memory.get(key, {}).get("slots")))
+
+	if options.output is not None:
+		with open(options.output, 'w') as f:
+			json.dump(results, f, indent=2, sort_keys=True)
+			f.write("\n")
+
+if __name__ == "__main__":
+	main()
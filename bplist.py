@@ -0,0 +1,236 @@
+#!/usr/bin/env python
+# -*- coding: utf8 -*-
+
+import plistlib
+import struct
+
+MAGIC = "bplist00"
+
+REF_FORMATS = { 1: "B", 2: "H", 4: "L", 8: "Q" }
+
+# Padding, sort version, offset size, reference size, object count, root object and offset table offset.
+TRAILER_FORMAT = ">5xBBBQQQ"
+TRAILER_SIZE = struct.calcsize(TRAILER_FORMAT)
+
+def int_size(value):
+	if value < 1 << 8:
+		return 1
+	elif value < 1 << 16:
+		return 2
+	elif value < 1 << 32:
+		return 4
+	else:
+		return 8
+
+class BinaryPlistWriter(object):
+	"""Writer for the binary property list format (bplist00).
+
+	Strings, numbers and booleans are uniqued, so each distinct value is stored once and shared by every
+	reference to it; book indices, damage types, tags and common trait names all collapse to a single
+	object each. Dictionary keys are written in sorted order, as plistlib does for XML.
+	"""
+
+	def __init__(self, file):
+		self.file = file
+
+	def write(self, root):
+		self.objects = []
+		self.scalar_refs = {}
+		self.container_refs = {}
+		self.flatten(root)
+
+		self.ref_size = int_size(len(self.objects))
+		self.ref_format = REF_FORMATS[self.ref_size]
+
+		self.position = 0
+		self.write_bytes(MAGIC)
+
+		offsets = []
+		for value in self.objects:
+			offsets.append(self.position)
+			self.write_object(value)
+
+		offset_table_offset = self.position
+		offset_size = int_size(offset_table_offset)
+		self.write_bytes(struct.pack(">%d%s" % (len(offsets), REF_FORMATS[offset_size]), *offsets))
+
+		self.write_bytes(struct.pack(TRAILER_FORMAT, 0, offset_size, self.ref_size,
+									 len(self.objects), 0, offset_table_offset))
+
+	def write_bytes(self, data):
+		self.file.write(data)
+		self.position += len(data)
+
+	def scalar_key(self, value):
+		# bool is a subclass of int, and 1 == 1.0 == True, so the type has to be part of the key.
+		if isinstance(value, bool):
+			return ("bool", value)
+		elif isinstance(value, (int, long)):
+			return ("int", value)
+		elif isinstance(value, float):
+			return ("real", value)
+		elif isinstance(value, str):
+			return ("string", unicode(value, 'utf8'))
+		elif isinstance(value, unicode):
+			return ("string", value)
+		else:
+			raise TypeError("unsupported type: %s" % type(value))
+
+	def flatten(self, value):
+		if isinstance(value, (dict, list, tuple)):
+			if id(value) in self.container_refs:
+				return
+
+			self.container_refs[id(value)] = len(self.objects)
+			self.objects.append(value)
+
+			if isinstance(value, dict):
+				keys = sorted(value.keys())
+				for key in keys:
+					if not isinstance(key, (str, unicode)):
+						raise TypeError("keys must be strings")
+					self.flatten(key)
+				for key in keys:
+					self.flatten(value[key])
+			else:
+				for item in value:
+					self.flatten(item)
+		else:
+			key = self.scalar_key(value)
+			if key in self.scalar_refs:
+				return
+
+			self.scalar_refs[key] = len(self.objects)
+			self.objects.append(value)
+
+	def ref(self, value):
+		if isinstance(value, (dict, list, tuple)):
+			return self.container_refs[id(value)]
+		else:
+			return self.scalar_refs[self.scalar_key(value)]
+
+	def write_refs(self, values):
+		refs = [ self.ref(value) for value in values ]
+		self.write_bytes(struct.pack(">%d%s" % (len(refs), self.ref_format), *refs))
+
+	def write_marker(self, token, count):
+		if count < 15:
+			self.write_bytes(chr(token | count))
+		else:
+			self.write_bytes(chr(token | 0xf))
+			self.write_int(count)
+
+	def write_int(self, value):
+		if value < 0:
+			self.write_bytes("\x13" + struct.pack(">q", value))
+		elif value < 1 << 8:
+			self.write_bytes("\x10" + struct.pack(">B", value))
+		elif value < 1 << 16:
+			self.write_bytes("\x11" + struct.pack(">H", value))
+		elif value < 1 << 32:
+			self.write_bytes("\x12" + struct.pack(">L", value))
+		elif value < 1 << 63:
+			self.write_bytes("\x13" + struct.pack(">q", value))
+		else:
+			raise OverflowError("integer too large for plist: %d" % value)
+
+	def write_object(self, value):
+		if isinstance(value, bool):
+			self.write_bytes("\x09" if value else "\x08")
+		elif isinstance(value, (int, long)):
+			self.write_int(value)
+		elif isinstance(value, float):
+			self.write_bytes("\x23" + struct.pack(">d", value))
+		elif isinstance(value, (str, unicode)):
+			if isinstance(value, str):
+				value = unicode(value, 'utf8')
+			try:
+				data = value.encode('ascii')
+				self.write_marker(0x50, len(data))
+			except UnicodeEncodeError:
+				data = value.encode('utf-16be')
+				self.write_marker(0x60, len(data) // 2)
+			self.write_bytes(data)
+		elif isinstance(value, dict):
+			keys = sorted(value.keys())
+			self.write_marker(0xd0, len(keys))
+			self.write_refs(keys)
+			self.write_refs([ value[key] for key in keys ])
+		elif isinstance(value, (list, tuple)):
+			self.write_marker(0xa0, len(value))
+			self.write_refs(value)
+
+
+class BinaryPlistError(Exception):
+	pass
+
+class BinaryPlistReader(object):
+	"""Reader for the binary property list format, for the types BinaryPlistWriter writes.
+
+	Values come back as plistlib would return them from XML: ASCII strings as str and others as unicode.
+	"""
+
+	def __init__(self, data):
+		self.data = data
+
+	def read(self):
+		if self.data[:len(MAGIC)] != MAGIC or len(self.data) < len(MAGIC) + TRAILER_SIZE:
+			raise BinaryPlistError("Not a binary plist")
+
+		try:
+			(sort_version, offset_size, self.ref_size, count, root, offset_table_offset) = struct.unpack(
+				TRAILER_FORMAT, self.data[-TRAILER_SIZE:])
+			self.ref_format = REF_FORMATS[self.ref_size]
+			self.offsets = struct.unpack_from(">%d%s" % (count, REF_FORMATS[offset_size]), self.data,
+											  offset_table_offset)
+			return self.read_object(root)
+		except (struct.error, IndexError, KeyError):
+			raise BinaryPlistError("Truncated or corrupt binary plist")
+
+	def read_refs(self, position, count):
+		return struct.unpack_from(">%d%s" % (count, self.ref_format), self.data, position)
+
+	def read_marker(self, position):
+		"""Return the token and count of the object at position, and the position of what follows them."""
+		marker = ord(self.data[position])
+		(token, count) = (marker & 0xf0, marker & 0x0f)
+		position += 1
+		if count == 0xf and token not in (0x00, 0x10, 0x20):
+			(count, position) = self.read_int(position)
+		return (token, count, position)
+
+	def read_int(self, position):
+		size = 1 << (ord(self.data[position]) & 0x0f)
+		value = struct.unpack_from(">" + { 1: "B", 2: "H", 4: "L", 8: "q" }[size], self.data, position + 1)[0]
+		return (value, position + 1 + size)
+
+	def read_object(self, ref):
+		position = self.offsets[ref]
+		(token, count, start) = self.read_marker(position)
+		if token == 0x00 and count in (0x08, 0x09):
+			return count == 0x09
+		elif token == 0x10:
+			return self.read_int(position)[0]
+		elif token == 0x20 and count in (2, 3):
+			return struct.unpack_from(">f" if count == 2 else ">d", self.data, start)[0]
+		elif token == 0x50:
+			return self.data[start:start + count]
+		elif token == 0x60:
+			return self.data[start:start + count * 2].decode('utf-16be')
+		elif token == 0xa0:
+			return [ self.read_object(item) for item in self.read_refs(start, count) ]
+		elif token == 0xd0:
+			keys = self.read_refs(start, count)
+			values = self.read_refs(start + count * self.ref_size, count)
+			return dict((self.read_object(key), self.read_object(value)) for key, value in zip(keys, values))
+		else:
+			raise BinaryPlistError("Unsupported object type 0x%02x" % (token | count))
+
+def read_plist(path):
+	"""Read a plist from path, binary or XML."""
+	with open(path, 'rb') as f:
+		data = f.read()
+	if data.startswith(MAGIC):
+		return BinaryPlistReader(data).read()
+	else:
+		return plistlib.readPlistFromString(data)
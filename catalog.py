@@ -0,0 +1,84 @@
+#!/usr/bin/env python
+# -*- coding: utf8 -*-
+
+import argparse
+import itertools
+import json
+import multiprocessing
+import os
+import sys
+
+import base
+import monster
+import spell
+
+def scan_file(args):
+	(scanner_class, filename) = args
+
+	try:
+		scanner = scanner_class(filename)
+		try:
+			scanner.parse()
+			return (scanner.entry(), None)
+		finally:
+			scanner.close()
+	except base.ParseException, e:
+		return (None, (e.lineno, e.message))
+
+def scan_files(scanner_class, filenames, pool=None):
+	"""Generate the catalog entry of each file, in order, printing errors as they're reached."""
+	tasks = [ (scanner_class, filename) for filename in filenames ]
+	if pool is not None:
+		results = pool.imap(scan_file, tasks, 64)
+	else:
+		results = itertools.imap(scan_file, tasks)
+
+	for filename, (entry, error) in itertools.izip(filenames, results):
+		if error is not None:
+			(lineno, message) = error
+			print >>sys.stderr, "%s:%d:%s" % (filename, lineno, message)
+		else:
+			yield entry
+
+def file_type_of(filename):
+	"""Return whether a file is one of the Monsters or the Spells, from the directories it's in."""
+	parts = os.path.abspath(filename).split(os.sep)
+	if "Spells" in parts:
+		return 'Spells'
+	else:
+		return 'Monsters'
+
+def main():
+	argparser = argparse.ArgumentParser(
+		description="List the name, sources and headline details of each monster and spell, as JSON Lines, "
+		"reading only as far into each file as they need.")
+	argparser.add_argument("-j", "--jobs", type=int, default=1,
+						   help="number of worker processes to scan files with")
+	argparser.add_argument("files", nargs="*",
+						   help="files to scan, instead of the Monsters and Spells directories")
+	options = argparser.parse_args()
+
+	pool = None
+	if options.jobs > 1:
+		pool = multiprocessing.Pool(options.jobs)
+
+	try:
+		for record_type, scanner_class, file_type in (("monster", monster.MonsterScanner, 'Monsters'),
+													  ("spell", spell.SpellScanner, 'Spells')):
+			if len(options.files):
+				# Each file is scanned as the type it is, not as both.
+				filenames = [ filename for filename in options.files if file_type_of(filename) == file_type ]
+			else:
+				filenames = base.local_files(file_type, [])
+
+			for entry in scan_files(scanner_class, filenames, pool):
+				object = dict(entry.object(), type=record_type)
+				# Keys are left unsorted, since sorting them keeps json from using its much faster C encoder.
+				print json.dumps(object, ensure_ascii=False, separators=(",", ":")).encode('utf8')
+	finally:
+		if pool is not None:
+			pool.close()
+			pool.join()
+
+if __name__ == "__main__":
+	main()
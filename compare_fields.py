@@ -0,0 +1,71 @@
+#!/usr/bin/env python
+# -*- coding: utf8 -*-
+
+import argparse
+import sys
+
+import base
+import monster
+
+# Each field's original expression, and the scanner that replaced it.
+FIELDS = {
+	"Damage Resistances": (monster.DAMAGE_RESISTANCES_RE, monster.match_damage_resistances),
+	"Damage Immunities": (monster.DAMAGE_IMMUNITIES_RE, monster.match_damage_immunities),
+	"Languages": (monster.LANGUAGES_RE, monster.match_languages),
+}
+
+class FieldCollector(monster.MonsterParser):
+	"""Parser that keeps the damage and language lines of a monster, along with where they came from."""
+
+	def __init__(self, *args, **kwargs):
+		super(FieldCollector, self).__init__(*args, **kwargs)
+		self.fields = []
+
+	def handle_damage_resistances(self, line):
+		self.fields.append(("Damage Resistances", self.lineno, line))
+
+	def handle_damage_immunities(self, line):
+		self.fields.append(("Damage Immunities", self.lineno, line))
+
+	def handle_languages(self, line):
+		self.fields.append(("Languages", self.lineno, line))
+
+def compare_file(filename):
+	"""Return the number of lines in filename where the scanners and expressions disagree."""
+	parser = FieldCollector(filename)
+	try:
+		parser.parse()
+	finally:
+		parser.close()
+
+	mismatches = 0
+	for label, lineno, line in parser.fields:
+		(regex, scanner) = FIELDS[label]
+		match = regex.match(line)
+		expected = match.groups() if match is not None else None
+		actual = scanner(line)
+		if actual != expected:
+			print "%s:%d:%s: %r != %r" % (filename, lineno, label, actual, expected)
+			mismatches += 1
+
+	return mismatches
+
+def main():
+	argparser = argparse.ArgumentParser(
+		description="Check the damage and language scanners give the same groups as the expressions they replaced.")
+	argparser.add_argument("files", nargs="*",
+						   help="files to check, instead of the Monsters directory")
+	options = argparser.parse_args()
+
+	mismatches = 0
+	for filename in base.local_files('Monsters', options.files):
+		try:
+			mismatches += compare_file(filename)
+		except base.ParseException, e:
+			print >>sys.stderr, "%s:%d:%s" % (e.filename, e.lineno, e.message)
+
+	if mismatches:
+		sys.exit(1)
+
+if __name__ == "__main__":
+	main()
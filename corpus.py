@@ -0,0 +1,366 @@
+#!/usr/bin/env python
+# -*- coding: utf8 -*-
+
+import argparse
+import codecs
+import os
+import random
+
+import monster
+import spell
+
+# Names are built from the record number, so every record in a corpus has a different one.
+SYLLABLES = [ "ar", "bel", "cor", "dun", "eth", "fal", "gor", "hal", "ith", "jor", "kel", "lun",
+			  "mor", "nar", "oth", "pel", "quor", "rin", "sal", "tor", "ul", "var", "wen", "yth", "zor" ]
+MONSTER_NOUNS = [ "Drake", "Hound", "Wight", "Golem", "Troll", "Serpent", "Knight", "Shade", "Stalker",
+				  "Hag", "Ooze", "Wyrm", "Mage", "Brute", "Sentinel" ]
+SPELL_NOUNS = [ "Ward", "Bolt", "Sphere", "Sending", "Step", "Storm", "Veil", "Grasp", "Chant",
+				"Barrier", "Blessing", "Curse" ]
+
+SECTIONS = [ "Demons", "Devils", "Dragons (Chromatic)", "Giants", "Nonplayer Characters", "Yuan-ti" ]
+TAGS = [ "goblinoid", "shapechanger", "elf", "any race", "demon", "titan" ]
+
+ARMOR_CLASSES = [ "%d", "%d (natural armor)", "%d (leather armor)", "%d (chain mail, shield)",
+				  "%d (+1 plate)", "%d (15 with mage armor)", "%d (natural armor), 11 while prone" ]
+
+DAMAGE_RESISTANCES = [
+	"cold",
+	"acid, fire, lightning",
+	"bludgeoning, piercing, and slashing from nonmagical attacks",
+	"cold, fire; bludgeoning, piercing, and slashing from nonmagical attacks not made with silvered weapons",
+	"necrotic; bludgeoning and piercing from nonmagical attacks",
+	"psychic; slashing from magic weapons",
+	"bludgeoning, piercing, and slashing from nonmagical weapons that aren't silvered",
+	"one of the following: acid, cold, fire, or lightning",
+]
+DAMAGE_IMMUNITIES = [
+	"poison",
+	"fire, poison",
+	"poison; bludgeoning, piercing, and slashing from nonmagical attacks not made with adamantine weapons",
+	"bludgeoning, piercing, and slashing from nonmagical weapons",
+]
+LANGUAGES = [
+	"-",
+	"Common",
+	"Common, Goblin",
+	"Abyssal, Common, Draconic",
+	"Deep Speech, telepathy 60 ft.",
+	"Common plus one other language",
+	"any two languages",
+	"any one language (usually Common)",
+	"any languages it knew in life",
+	"understands Infernal but can't speak",
+	"understands Abyssal, Celestial, and Infernal but can't speak them",
+	"Sylvan, understands Common and Elvish but can't speak them, telepathy 120 ft.",
+	"understands commands given in any language but can't speak",
+	"Thieves' cant, telepathy 30 ft. (works only with creatures that understand Common)",
+]
+
+TRAITS = [
+	("Keen Smell.", [ "The creature has advantage on Wisdom (Perception) checks that rely on smell." ]),
+	("Magic Resistance.", [ "The creature has advantage on saving throws against spells and other magical effects." ]),
+	("Pack Tactics.", [
+		"The creature has advantage on an attack roll against a creature if at least one of its allies is within 5 feet of the creature and the ally isn't incapacitated.",
+	]),
+	("Amphibious.", [ "The creature can breathe air and water." ]),
+	("Legendary Resistance (3/Day).", [ "If the creature fails a saving throw, it can choose to succeed instead." ]),
+	("Spellcasting.", [
+		"The creature is a 5th-level spellcaster. Its spellcasting ability is Intelligence (spell save DC 13, +5 to hit with spell attacks).",
+		"Cantrips (at will): /fire bolt/, /light/, /mage hand/",
+		"1st level (4 slots): /magic missile/, /shield/",
+	]),
+]
+ACTIONS = [
+	("Bite.", [ "*Melee Weapon Attack:* +%(hit)d to hit, reach 5 ft., one target. *Hit:* 7 (1d8 + 3) piercing damage." ]),
+	("Claw.", [ "*Melee Weapon Attack:* +%(hit)d to hit, reach 5 ft., one target. *Hit:* 10 (2d6 + 3) slashing damage plus 3 (1d6) poison damage." ]),
+	("Longbow.", [ "*Ranged Weapon Attack:* +%(hit)d to hit, range 150/600 ft., one target. *Hit:* 6 (1d8 + 2) piercing damage." ]),
+	(u"Breath Weapon (Recharge 5–6).", [
+		"The creature exhales fire in a 30-foot cone. Each creature in that area must make a DC 15 Dexterity saving throw, taking 28 (8d6) fire damage on a failed save, or half as much damage on a successful one.",
+	]),
+	("Frightful Presence.", [
+		"Each creature of the creature's choice that is within 120 feet of it and aware of it must succeed on a DC 16 Wisdom saving throw or become frightened for 1 minute.",
+		"A creature can repeat the saving throw at the end of each of its turns, ending the effect on itself on a success.",
+	]),
+]
+REACTIONS = [
+	("Parry.", [ "The creature adds 2 to its AC against one melee attack that would hit it. To do so, the creature must see the attacker and be wielding a melee weapon." ]),
+]
+LEGENDARY_ACTIONS = [
+	("Detect.", [ "The creature makes a Wisdom (Perception) check." ]),
+	("Tail Attack.", [ "The creature makes a tail attack." ]),
+	("Wing Attack (Costs 2 Actions).", [
+		"The creature beats its wings. Each creature within 10 feet of it must succeed on a DC 19 Dexterity saving throw or take 13 (2d6 + 6) bludgeoning damage and be knocked prone.",
+	]),
+]
+LAIR_EFFECTS = [
+	u"• Part of the ceiling collapses above one creature that the creature can see within 120 feet of it.",
+	u"• A cloud of swarming insects fills a 20-foot-radius sphere centered on a point the creature chooses.",
+	u"• Magical darkness spreads from a point the creature chooses within 60 feet of it, filling a 15-foot-radius sphere.",
+]
+
+SPELL_LEVELS = [ "1st", "2nd", "3rd", "4th", "5th", "6th", "7th", "8th", "9th" ]
+CASTING_TIMES = [ "1 action", "1 bonus action", "1 minute", "10 minutes", "1 hour", "8 hours",
+				  "1 action or 8 hours", "1 reaction, which you take when you see a creature within 60 feet of you casting a spell" ]
+RANGES = [ "Self", "Touch", "Sight", "Special", "Unlimited", "30 feet", "120 feet", "1 mile", "500 miles",
+		   "Self (15-foot cone)", "Self (10-foot radius)", "Self (30-foot line)", "Self (5-mile radius)",
+		   "Self (10-foot-radius sphere)" ]
+COMPONENTS = [ "V", "S", "V, S", "V, S, M (a pinch of sulfur)", "S, M (a bit of fur)", "M (a tiny silver whistle)" ]
+DURATIONS = [ "Instantaneous", "Special", "1 round", "1 minute", "Concentration, up to 1 minute",
+			  "Concentration, up to 10 minutes", "Up to 1 hour", "8 hours", "24 hours", "10 days",
+			  "Until dispelled", "Until dispelled or triggered" ]
+SPELL_TEXT = [
+	"You create a shimmering barrier around a creature you can see within range.",
+	"Each creature in a 20-foot-radius sphere centered on that point must make a Constitution saving throw. A target takes 4d6 thunder damage on a failed save, or half as much damage on a successful one.",
+	"***At Higher Levels.*** When you cast this spell using a spell slot of 3rd level or higher, the damage increases by 1d6 for each slot level above 2nd.",
+	"The target can't take reactions until the start of its next turn.",
+]
+
+def record_name(index, nouns):
+	parts = []
+	while True:
+		parts.append(SYLLABLES[index % len(SYLLABLES)])
+		index //= len(SYLLABLES)
+		if not index:
+			break
+	return "".join(parts).title() + " " + nouns[len(parts) % len(nouns)]
+
+def filename_for(name):
+	return name.lower().replace(" ", "-") + ".txt"
+
+def ability_score(score):
+	return "%d (%+d)" % (score, (score - 10) // 2)
+
+def add_entries(lines, entries, hit):
+	for title, text in entries:
+		lines.append("")
+		lines.append(title)
+		lines.extend(line % { "hit": hit } if "%(" in line else line for line in text)
+
+def add_effects(lines, intro, effects, closing):
+	lines.append("")
+	lines.append(intro)
+	for effect in effects:
+		lines.append("")
+		lines.append(effect)
+	if closing is not None:
+		lines.append("")
+		lines.append(closing)
+
+def monster_lines(rng, index):
+	name = record_name(index, MONSTER_NOUNS)
+	lines = [ name ]
+
+	if rng.random() < 0.1:
+		lines.append("was " + record_name(index, MONSTER_NOUNS[::-1]))
+	source = "mm %d" % rng.randint(1, 350)
+	if rng.random() < 0.3:
+		source += "; " + rng.choice(SECTIONS)
+	lines.append(source)
+	if rng.random() < 0.2:
+		lines.append("dmbr %d" % rng.randint(1, 60))
+	if rng.random() < 0.1:
+		lines.append("npc")
+	lines.extend(sorted(rng.sample(monster.ENVIRONMENTS, rng.randint(0, 2))))
+
+	size = rng.choice(monster.SIZES).title()
+	monster_type = rng.choice(monster.MONSTER_TYPES)
+	if rng.random() < 0.05:
+		size_type = "%s swarm of Tiny %ss" % (size, monster_type)
+	else:
+		size_type = "%s %s" % (size, monster_type)
+	if rng.random() < 0.2:
+		size_type += " (%s)" % ", ".join(rng.sample(TAGS, rng.randint(1, 2)))
+	alignment = rng.random()
+	if alignment < 0.8:
+		alignment = rng.choice(monster.ALIGNMENTS)
+	elif alignment < 0.9:
+		alignment = rng.choice(sorted(monster.ALIGNMENT_OPTIONS.keys()))
+	else:
+		weight = rng.choice([ 25, 40, 50 ])
+		alignment = "%s (%d%%) or %s (%d%%)" % (rng.choice(monster.ALIGNMENTS), 100 - weight,
+												rng.choice(monster.ALIGNMENTS), weight)
+	lines.append("%s, %s" % (size_type, alignment))
+
+	scores = [ rng.randint(3, 30) for ability in monster.SHORT_ABILITIES ]
+	con_modifier = (scores[2] - 10) // 2
+	hit_dice = rng.randint(1, 30)
+	hit_points = hit_dice * 5 + hit_dice * con_modifier
+	if con_modifier:
+		hit_points_dice = "%dd8 %s %d" % (hit_dice, "+" if con_modifier > 0 else "-", abs(hit_dice * con_modifier))
+	else:
+		hit_points_dice = "%dd8" % hit_dice
+	speed = "%d ft." % rng.choice([ 0, 20, 30, 40 ])
+	if rng.random() < 0.2:
+		speed += ", climb 30 ft."
+	if rng.random() < 0.3:
+		speed += ", fly %d ft." % rng.choice([ 60, 80 ]) + rng.choice([ "", " (hover)" ])
+	if rng.random() < 0.2:
+		speed += ", swim 40 ft."
+
+	lines.append("")
+	lines.append("Armor Class " + rng.choice(ARMOR_CLASSES) % rng.randint(10, 22))
+	lines.append("Hit Points %d (%s)" % (max(hit_points, 1), hit_points_dice))
+	lines.append("Speed " + speed)
+
+	lines.append("")
+	for ability, score in zip(monster.SHORT_ABILITIES, scores):
+		lines.append("%s %s" % (ability.upper(), ability_score(score)))
+
+	proficiency = rng.randint(2, 9)
+	details = []
+	if rng.random() < 0.4:
+		saving_throws = rng.sample(range(len(monster.SHORT_ABILITIES)), rng.randint(1, 4))
+		details.append("Saving Throws " + ", ".join(
+			"%s %+d" % (monster.SHORT_ABILITIES[ability], (scores[ability] - 10) // 2 + proficiency)
+			for ability in sorted(saving_throws)))
+	perception = None
+	if rng.random() < 0.5:
+		skills = [ ("Perception", 4), ("Stealth", 1) ] if rng.random() < 0.5 else [ ("Athletics", 0), ("History", 3) ]
+		skill_modifiers = [ (skill, (scores[ability] - 10) // 2 + proficiency) for skill, ability in skills ]
+		details.append("Skills " + ", ".join("%s %+d" % skill_modifier for skill_modifier in skill_modifiers))
+		perception = dict(skill_modifiers).get("Perception")
+	if rng.random() < 0.05:
+		details.append("Damage Vulnerabilities " + rng.choice([ "fire", "bludgeoning, thunder" ]))
+	if rng.random() < 0.2:
+		details.append("Damage Resistances " + rng.choice(DAMAGE_RESISTANCES))
+	if rng.random() < 0.02:
+		details.append("Damage Resistance damage from spells; nonmagical bludgeoning, piercing, and slashing (from stoneskin)")
+	if rng.random() < 0.2:
+		details.append("Damage Immunities " + rng.choice(DAMAGE_IMMUNITIES))
+	if rng.random() < 0.2:
+		details.append("Condition Immunities " + ", ".join(sorted(rng.sample(monster.CONDITIONS, rng.randint(1, 3)))))
+	if perception is not None:
+		passive = 10 + perception
+	else:
+		passive = 10 + (scores[4] - 10) // 2
+	senses = []
+	if rng.random() < 0.1:
+		senses.append("blindsight 30 ft." + rng.choice([ "", " (blind beyond this radius)" ]))
+	if rng.random() < 0.5:
+		senses.append("darkvision %d ft." % rng.choice([ 60, 120 ]))
+	if rng.random() < 0.05:
+		senses.append("truesight 120 ft.")
+	senses.append("passive Perception %d" % passive)
+	details.append("Senses " + ", ".join(senses))
+	details.append("Languages " + rng.choice(LANGUAGES))
+	challenge = rng.choice(sorted(monster.XP.keys()))
+	details.append("Challenge %s (%s XP)" % (challenge, monster.XP[challenge]))
+
+	lines.append("")
+	lines.extend(details)
+
+	hit = proficiency + rng.randint(0, 5)
+	add_entries(lines, rng.sample(TRAITS, rng.randint(0, 3)), hit)
+
+	lines.append("")
+	lines.append("ACTIONS")
+	add_entries(lines, rng.sample(ACTIONS, rng.randint(1, 3)), hit)
+
+	if rng.random() < 0.05:
+		for form in range(1, rng.randint(2, 3) + 1):
+			lines.append("")
+			lines.append("ACTIONS FOR TYPE %d" % form)
+			add_entries(lines, rng.sample(ACTIONS, 1), hit)
+
+	if rng.random() < 0.2:
+		lines.append("")
+		lines.append("REACTIONS")
+		add_entries(lines, REACTIONS, hit)
+
+	if rng.random() < 0.15:
+		lines.append("")
+		lines.append("LEGENDARY ACTIONS")
+		lines.append("")
+		lines.append("The creature can take 3 legendary actions, choosing from the options below. Only one legendary action option can be used at a time and only at the end of another creature's turn.")
+		add_entries(lines, LEGENDARY_ACTIONS, hit)
+
+		if rng.random() < 0.5:
+			lines.append("")
+			lines.append("LAIR")
+			lines.append("")
+			lines.append("The creature dwells in a ruined keep at the edge of the marsh.")
+			lines.append("Bones of previous victims are scattered across the floor.")
+
+			lines.append("")
+			lines.append("LAIR ACTIONS")
+			add_effects(lines, "On initiative count 20 (losing initiative ties), the creature takes a lair action to cause one of the following effects:",
+						rng.sample(LAIR_EFFECTS, 2),
+						rng.choice([ None, "The creature can't repeat an effect until they have all been used." ]))
+
+			if rng.random() < 0.3:
+				lines.append("")
+				lines.append("LAIR TRAITS")
+				add_effects(lines, "The lair has the following magical properties:",
+							rng.sample(LAIR_EFFECTS, 2),
+							"If the creature dies, these effects end immediately.")
+
+			lines.append("")
+			lines.append("REGIONAL EFFECTS")
+			add_effects(lines, "The region containing the creature's lair is warped by its magic, which creates one or more of the following effects:",
+						rng.sample(LAIR_EFFECTS, rng.randint(1, 3)),
+						"If the creature dies, these effects fade over 1d10 days.")
+
+	return (name, lines)
+
+def spell_lines(rng, index):
+	name = record_name(index, SPELL_NOUNS)
+	lines = [ name ]
+
+	if rng.random() < 0.1:
+		lines.append("was " + record_name(index, SPELL_NOUNS[::-1]))
+	lines.append("phb %d" % rng.randint(1, 320))
+	if rng.random() < 0.3:
+		lines.append("pbr %d" % rng.randint(1, 110))
+	lines.extend(sorted(rng.sample(spell.CLASSES, rng.randint(1, 4)), key=spell.CLASSES.index))
+
+	level = rng.randint(0, 9)
+	school = rng.choice(spell.SCHOOLS)
+	if level == 0:
+		lines.append("%s cantrip" % school.title())
+	else:
+		lines.append("%s-level %s%s" % (SPELL_LEVELS[level - 1], school, rng.choice([ "", "", " (ritual)" ])))
+
+	lines.append("")
+	lines.append("Casting Time: " + rng.choice(CASTING_TIMES))
+	lines.append("Range: " + rng.choice(RANGES))
+	lines.append("Components: " + rng.choice(COMPONENTS))
+	lines.append("Duration: " + rng.choice(DURATIONS))
+
+	lines.append("")
+	lines.extend(rng.sample(SPELL_TEXT, rng.randint(1, len(SPELL_TEXT))))
+
+	return (name, lines)
+
+def write_record(dirname, name, lines):
+	if not os.path.isdir(dirname):
+		os.makedirs(dirname)
+
+	with codecs.open(os.path.join(dirname, filename_for(name)), 'w', 'utf8') as f:
+		for line in lines:
+			f.write(line)
+			f.write("\n")
+
+def generate(path, count, seed=0):
+	"""Write count monsters and count spells under path, laid out like the Monsters and Spells directories."""
+	rng = random.Random(seed)
+	for index in range(count):
+		(name, lines) = monster_lines(rng, index)
+		write_record(os.path.join(path, "Monsters", "mm"), name, lines)
+	for index in range(count):
+		(name, lines) = spell_lines(rng, index)
+		write_record(os.path.join(path, "Spells", "phb"), name, lines)
+
+def main():
+	argparser = argparse.ArgumentParser(description="Generate a synthetic corpus of monsters and spells.")
+	argparser.add_argument("-n", "--count", type=int, default=1000,
+						   help="number of monsters, and of spells, to generate")
+	argparser.add_argument("--seed", type=int, default=0,
+						   help="seed for the random choices, the same seed always gives the same corpus")
+	argparser.add_argument("path",
+						   help="directory to write the Monsters and Spells directories into")
+	options = argparser.parse_args()
+
+	generate(options.path, options.count, options.seed)
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,297 @@
+#!/usr/bin/env python
+# -*- coding: utf8 -*-
+
+import hashlib
+import json
+import os
+import sqlite3
+
+import monster
+import spell
+
+# Tables naming the values the export stores as indices.
+LOOKUP_TABLES = [
+	("environments", monster.ENVIRONMENTS),
+	("monster_types", monster.MONSTER_TYPES),
+	("sizes", monster.SIZES),
+	("classes", spell.CLASSES),
+	("schools", spell.SCHOOLS),
+]
+
+def columns(struct_class):
+	"""Return the column definitions for the fields of a base.Struct, which are named for their keys."""
+	return "".join(",\n\t\"%s\"" % name for name in struct_class.__slots__)
+
+SCHEMA = "".join("CREATE TABLE IF NOT EXISTS %s (id INTEGER PRIMARY KEY, name TEXT NOT NULL);\n" % table
+				 for table, names in LOOKUP_TABLES) + """
+CREATE TABLE IF NOT EXISTS files (
+	id INTEGER PRIMARY KEY,
+	filename TEXT NOT NULL UNIQUE,
+	key TEXT NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS books (
+	id INTEGER PRIMARY KEY,
+	tag TEXT NOT NULL,
+	name TEXT NOT NULL,
+	type INTEGER NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS monsters (
+	id INTEGER PRIMARY KEY,
+	file_id INTEGER NOT NULL REFERENCES files(id) ON DELETE CASCADE,
+	name TEXT NOT NULL,
+	hash TEXT NOT NULL,
+	object TEXT NOT NULL%(monster_columns)s
+);
+CREATE INDEX IF NOT EXISTS monsters_file_id ON monsters(file_id);
+CREATE INDEX IF NOT EXISTS monsters_name ON monsters(name);
+CREATE INDEX IF NOT EXISTS monsters_challenge ON monsters(challenge);
+CREATE INDEX IF NOT EXISTS monsters_rawType ON monsters(rawType);
+CREATE INDEX IF NOT EXISTS monsters_rawSize ON monsters(rawSize);
+
+CREATE TABLE IF NOT EXISTS monster_names (
+	monster_id INTEGER NOT NULL REFERENCES monsters(id) ON DELETE CASCADE,
+	name TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS monster_names_monster_id ON monster_names(monster_id);
+CREATE INDEX IF NOT EXISTS monster_names_name ON monster_names(name);
+
+CREATE TABLE IF NOT EXISTS monster_sources (
+	monster_id INTEGER NOT NULL REFERENCES monsters(id) ON DELETE CASCADE,
+	book INTEGER NOT NULL REFERENCES books(id) DEFERRABLE INITIALLY DEFERRED,
+	page INTEGER NOT NULL,
+	section TEXT
+);
+CREATE INDEX IF NOT EXISTS monster_sources_monster_id ON monster_sources(monster_id);
+CREATE INDEX IF NOT EXISTS monster_sources_book ON monster_sources(book);
+
+CREATE TABLE IF NOT EXISTS monster_environments (
+	monster_id INTEGER NOT NULL REFERENCES monsters(id) ON DELETE CASCADE,
+	environment INTEGER NOT NULL REFERENCES environments(id) DEFERRABLE INITIALLY DEFERRED
+);
+CREATE INDEX IF NOT EXISTS monster_environments_monster_id ON monster_environments(monster_id);
+CREATE INDEX IF NOT EXISTS monster_environments_environment ON monster_environments(environment, monster_id);
+
+CREATE TABLE IF NOT EXISTS lairs (
+	monster_id INTEGER PRIMARY KEY REFERENCES monsters(id) ON DELETE CASCADE%(lair_columns)s
+);
+
+CREATE TABLE IF NOT EXISTS spells (
+	id INTEGER PRIMARY KEY,
+	file_id INTEGER NOT NULL REFERENCES files(id) ON DELETE CASCADE,
+	name TEXT NOT NULL,
+	hash TEXT NOT NULL,
+	object TEXT NOT NULL%(spell_columns)s
+);
+CREATE INDEX IF NOT EXISTS spells_file_id ON spells(file_id);
+CREATE INDEX IF NOT EXISTS spells_name ON spells(name);
+CREATE INDEX IF NOT EXISTS spells_rawLevel ON spells(rawLevel);
+CREATE INDEX IF NOT EXISTS spells_rawSchool ON spells(rawSchool);
+
+CREATE TABLE IF NOT EXISTS spell_names (
+	spell_id INTEGER NOT NULL REFERENCES spells(id) ON DELETE CASCADE,
+	name TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS spell_names_spell_id ON spell_names(spell_id);
+CREATE INDEX IF NOT EXISTS spell_names_name ON spell_names(name);
+
+CREATE TABLE IF NOT EXISTS spell_sources (
+	spell_id INTEGER NOT NULL REFERENCES spells(id) ON DELETE CASCADE,
+	book INTEGER NOT NULL REFERENCES books(id) DEFERRABLE INITIALLY DEFERRED,
+	page INTEGER NOT NULL,
+	section TEXT
+);
+CREATE INDEX IF NOT EXISTS spell_sources_spell_id ON spell_sources(spell_id);
+CREATE INDEX IF NOT EXISTS spell_sources_book ON spell_sources(book);
+
+CREATE TABLE IF NOT EXISTS spell_classes (
+	spell_id INTEGER NOT NULL REFERENCES spells(id) ON DELETE CASCADE,
+	class INTEGER NOT NULL REFERENCES classes(id) DEFERRABLE INITIALLY DEFERRED
+);
+CREATE INDEX IF NOT EXISTS spell_classes_spell_id ON spell_classes(spell_id);
+CREATE INDEX IF NOT EXISTS spell_classes_class ON spell_classes(class, spell_id);
+
+-- Traits, actions, lair entries and spell descriptions, so they can be searched together.
+CREATE TABLE IF NOT EXISTS texts (
+	id INTEGER PRIMARY KEY,
+	monster_id INTEGER REFERENCES monsters(id) ON DELETE CASCADE,
+	spell_id INTEGER REFERENCES spells(id) ON DELETE CASCADE,
+	kind TEXT NOT NULL,
+	position INTEGER NOT NULL,
+	name TEXT,
+	text TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS texts_monster_id ON texts(monster_id, kind, position);
+CREATE INDEX IF NOT EXISTS texts_spell_id ON texts(spell_id);
+
+CREATE VIEW IF NOT EXISTS traits AS
+	SELECT id, monster_id, position, name, text FROM texts WHERE kind = 'trait';
+CREATE VIEW IF NOT EXISTS actions AS
+	SELECT id, monster_id, kind, position, name, text FROM texts WHERE kind IN ('action', 'reaction', 'legendary');
+CREATE VIEW IF NOT EXISTS lair_entries AS
+	SELECT id, monster_id, kind, position, text FROM texts
+	WHERE kind IN ('lairAction', 'lairTrait', 'regionalEffect');
+
+CREATE VIRTUAL TABLE IF NOT EXISTS text_search USING fts5(name, text, content='texts', content_rowid='id');
+
+-- Keep the search index in step with texts, including rows removed along with their monster or spell.
+CREATE TRIGGER IF NOT EXISTS texts_insert AFTER INSERT ON texts BEGIN
+	INSERT INTO text_search(rowid, name, text) VALUES (new.id, new.name, new.text);
+END;
+CREATE TRIGGER IF NOT EXISTS texts_delete AFTER DELETE ON texts BEGIN
+	INSERT INTO text_search(text_search, rowid, name, text) VALUES ('delete', old.id, old.name, old.text);
+END;
+""" % {
+	"monster_columns": columns(monster.MonsterInfo),
+	"lair_columns": columns(monster.LairInfo),
+	"spell_columns": columns(spell.SpellInfo),
+}
+
+def schema_statements():
+	# executescript() would commit the transaction first, so the schema is run a statement at a time.
+	statement = ""
+	for line in SCHEMA.splitlines(True):
+		statement += line
+		if sqlite3.complete_statement(statement):
+			yield statement
+			statement = ""
+
+def schema_fingerprint():
+	"""Return a hash of the schema and the source of this module, which together decide what's stored for a record."""
+	digest = hashlib.sha1(SCHEMA)
+	with open(os.path.splitext(__file__)[0] + ".py", 'rb') as source_file:
+		digest.update(source_file.read())
+	return digest.hexdigest()
+
+def encode_object(object):
+	return json.dumps(object, ensure_ascii=False, sort_keys=True, separators=(",", ":"))
+
+class Database(object):
+	"""SQLite database of the export, with a table for each kind of thing and full-text search over the text.
+
+	Records are kept along with the file they came from, and files with the key they were exported with,
+	so bringing the database up to date only needs the files whose key has changed exported again. The
+	whole update is made in a single transaction, so readers see either the old database or the new one.
+
+	The schema fingerprint is kept in PRAGMA user_version, and a database made with a different one has
+	all its tables dropped and made again, so none of it is kept in the old form.
+	"""
+
+	def __init__(self, path):
+		# Transactions are begun and committed explicitly, so the schema is created inside one as well.
+		self.connection = sqlite3.connect(path, isolation_level=None)
+		self.connection.execute("PRAGMA foreign_keys = ON")
+
+	def begin(self, books, bookTags):
+		self.connection.execute("BEGIN")
+
+		# user_version is a 32-bit integer, so it only holds part of the fingerprint.
+		user_version = int(schema_fingerprint()[:7], 16)
+		if self.connection.execute("PRAGMA user_version").fetchone()[0] != user_version:
+			self.drop_schema()
+			self.connection.execute("PRAGMA user_version = %d" % user_version)
+
+		# References to the books and lookup tables are only checked on commit, so they can be refilled here.
+		for statement in schema_statements():
+			self.connection.execute(statement)
+
+		self.connection.execute("DELETE FROM books")
+		self.connection.executemany("INSERT INTO books (id, tag, name, type) VALUES (?, ?, ?, ?)",
+									[ (index, tag, book["name"], book["type"])
+									  for index, (tag, book) in enumerate(zip(bookTags, books)) ])
+
+		for table, names in LOOKUP_TABLES:
+			self.connection.execute("DELETE FROM %s" % table)
+			self.connection.executemany("INSERT INTO %s (id, name) VALUES (?, ?)" % table, enumerate(names))
+
+	def drop_schema(self):
+		schema = self.connection.execute("SELECT type, name, sql FROM sqlite_master").fetchall()
+		# Triggers first, so they don't fire as rows go, and the full-text index before the tables it keeps its
+		# data in, which go along with it. The rest go in reverse, so tables go before those they reference.
+		for type, name, sql in schema:
+			if type == "trigger":
+				self.connection.execute("DROP TRIGGER IF EXISTS \"%s\"" % name)
+		for type, name, sql in schema:
+			if type == "view":
+				self.connection.execute("DROP VIEW IF EXISTS \"%s\"" % name)
+		for type, name, sql in schema:
+			if type == "table" and sql.startswith("CREATE VIRTUAL TABLE"):
+				self.connection.execute("DROP TABLE IF EXISTS \"%s\"" % name)
+		for type, name, sql in reversed(schema):
+			if type == "table" and not name.startswith("sqlite_"):
+				self.connection.execute("DROP TABLE IF EXISTS \"%s\"" % name)
+
+	def commit(self):
+		self.connection.execute("COMMIT")
+
+	def close(self):
+		# Anything not committed is rolled back.
+		self.connection.close()
+
+	def file_keys(self):
+		return dict(self.connection.execute("SELECT filename, key FROM files"))
+
+	def remove_file(self, filename):
+		# Everything exported from the file goes with it.
+		self.connection.execute("DELETE FROM files WHERE filename = ?", (filename,))
+
+	def add_file(self, filename, key):
+		return self.connection.execute("INSERT INTO files (filename, key) VALUES (?, ?)", (filename, key)).lastrowid
+
+	def insert(self, table, values):
+		names = values.keys()
+		return self.connection.execute("INSERT INTO %s (%s) VALUES (%s)" % (
+			table, ", ".join("\"%s\"" % name for name in names), ", ".join("?" * len(names))),
+			[ values[name] for name in names ]).lastrowid
+
+	def insert_texts(self, owner, owner_id, kind, texts):
+		self.connection.executemany(
+			"INSERT INTO texts (%s, kind, position, name, text) VALUES (?, ?, ?, ?, ?)" % owner,
+			[ (owner_id, kind, position, name, text) for position, (name, text) in enumerate(texts) ])
+
+	def add_monster(self, file_id, object):
+		"""Add the exported object of a monster from the file."""
+		values = dict(object["info"])
+		values.update(file_id=file_id, name=object["name"], hash=object["hash"], object=encode_object(object))
+		monster_id = self.insert("monsters", values)
+
+		self.connection.executemany("INSERT INTO monster_names (monster_id, name) VALUES (?, ?)",
+									[ (monster_id, name) for name in object["names"] ])
+		self.connection.executemany(
+			"INSERT INTO monster_sources (monster_id, book, page, section) VALUES (?, ?, ?, ?)",
+			[ (monster_id, source["book"], source["page"], source.get("section")) for source in object["sources"] ])
+		self.connection.executemany("INSERT INTO monster_environments (monster_id, environment) VALUES (?, ?)",
+									[ (monster_id, environment) for environment in object["environments"] ])
+
+		for kind, key in (("trait", "traits"), ("action", "actions"), ("reaction", "reactions"),
+						  ("legendary", "legendaryActions")):
+			self.insert_texts("monster_id", monster_id, kind,
+							  [ (action.get("name"), action["text"]) for action in object[key] ])
+
+		lair = object.get("lair")
+		if lair is not None:
+			values = dict(lair["info"])
+			values.update(monster_id=monster_id)
+			self.insert("lairs", values)
+
+			for kind, key in (("lairAction", "lairActions"), ("lairTrait", "lairTraits"),
+							  ("regionalEffect", "regionalEffects")):
+				self.insert_texts("monster_id", monster_id, kind, [ (None, text) for text in lair[key] ])
+
+	def add_spell(self, file_id, object):
+		"""Add the exported object of a spell from the file."""
+		values = dict(object["info"])
+		values.update(file_id=file_id, name=object["name"], hash=object["hash"], object=encode_object(object))
+		spell_id = self.insert("spells", values)
+
+		self.connection.executemany("INSERT INTO spell_names (spell_id, name) VALUES (?, ?)",
+									[ (spell_id, name) for name in object["names"] ])
+		self.connection.executemany(
+			"INSERT INTO spell_sources (spell_id, book, page, section) VALUES (?, ?, ?, ?)",
+			[ (spell_id, source["book"], source["page"], source.get("section")) for source in object["sources"] ])
+		self.connection.executemany("INSERT INTO spell_classes (spell_id, class) VALUES (?, ?)",
+									[ (spell_id, character_class) for character_class in object["classes"] ])
+
+		if "text" in object["info"]:
+			self.insert_texts("spell_id", spell_id, "spell", [ (object["name"], object["info"]["text"]) ])
@@ -1,115 +1,1056 @@
 #!/usr/bin/env python
 # -*- coding: utf8 -*-
 
+import argparse
+import cPickle
+import hashlib
+import itertools
+import json
+import os
 import plistlib
 import re
+import shutil
 import sys
+import tempfile
 import time
 
 import base
 import monster
 import spell
 
-def main():
-	books = [
-		{
-			"name": "Player's Handbook",
-			"type": 0,
-		},
-		{
-			"name": "Monster Manual",
-			"type": 0,
-		},
-		{
-			"name": "Dungeon Master's Guide",
-			"type": 0,
-		},
-		{
-			"name": "Player's Basic Rules",
-			"type": 3,
-		},
-		{
-			"name": "Dungeon Master's Basic Rules",
-			"type": 3,
-		},
-		{
-			"name": "Lost Mine of Phandelver",
-			"type": 1,
-		},
-		{
-			"name": "Hoard of the Dragon Queen",
-			"type": 1,
-		},
-		{
-			"name": "Hoard of the Dragon Queen Online Supplement",
-			"type": 3,
-		},
-		{
-			"name": "The Rise of Tiamat",
-			"type": 1,
-		},
-		{
-			"name": "The Rise of Tiamat Online Supplement",
-			"type": 3,
-		},
-		{
-			"name": "Princes of the Apocalypse",
-			"type": 1,
-		},
-		{
-			"name": "Princes of the Apocalypse Online Supplement",
-			"type": 3,
-		},
-		{
-			"name": "Elemental Evil Player's Companion",
-			"type": 3,
-		},
-		{
-			"name": "Out of the Abyss",
-			"type": 1,
-		},
-		{
-			"name": "Sword Coast Adventurer's Guide",
-			"type": 2,
-		}
-	]
-	bookTags = [
-		"phb", "mm", "dmg", "pbr",  "dmbr",
-		"lmop", "hotdq", "hotdqs", "trot", "trots", "pota", "potas", "eepc", "oota",
-		"scag" ]
-
-	monsters = []
-	for filename in base.local_files('Monsters'):
-		parser = monster.MonsterExporter(filename, bookTags=bookTags)
+# bplist, database, m2fc, store, watch and multiprocessing are only imported by the options that use
+# them, since loading them all more than doubles the time to import this module.
+
+BOOKS = [
+	{
+		"name": "Player's Handbook",
+		"type": 0,
+	},
+	{
+		"name": "Monster Manual",
+		"type": 0,
+	},
+	{
+		"name": "Dungeon Master's Guide",
+		"type": 0,
+	},
+	{
+		"name": "Player's Basic Rules",
+		"type": 3,
+	},
+	{
+		"name": "Dungeon Master's Basic Rules",
+		"type": 3,
+	},
+	{
+		"name": "Lost Mine of Phandelver",
+		"type": 1,
+	},
+	{
+		"name": "Hoard of the Dragon Queen",
+		"type": 1,
+	},
+	{
+		"name": "Hoard of the Dragon Queen Online Supplement",
+		"type": 3,
+	},
+	{
+		"name": "The Rise of Tiamat",
+		"type": 1,
+	},
+	{
+		"name": "The Rise of Tiamat Online Supplement",
+		"type": 3,
+	},
+	{
+		"name": "Princes of the Apocalypse",
+		"type": 1,
+	},
+	{
+		"name": "Princes of the Apocalypse Online Supplement",
+		"type": 3,
+	},
+	{
+		"name": "Elemental Evil Player's Companion",
+		"type": 3,
+	},
+	{
+		"name": "Out of the Abyss",
+		"type": 1,
+	},
+	{
+		"name": "Sword Coast Adventurer's Guide",
+		"type": 2,
+	}
+]
+BOOK_TAGS = [
+	"phb", "mm", "dmg", "pbr",  "dmbr",
+	"lmop", "hotdq", "hotdqs", "trot", "trots", "pota", "potas", "eepc", "oota",
+	"scag" ]
+
+def select_books(tags=None):
+	"""Return the books and book tags to export, only those with the comma-separated tags if given.
+
+	Books keep the order of BOOKS, so each one's index is the same whichever tags are given in whatever order.
+	"""
+	if tags is None:
+		return (BOOKS, BOOK_TAGS)
+
+	tags = tags.split(",")
+	for tag in tags:
+		if tag not in BOOK_TAGS:
+			raise ValueError("Unknown book tag: %s" % tag)
+
+	bookTags = [ tag for tag in BOOK_TAGS if tag in tags ]
+	books = [ BOOKS[BOOK_TAGS.index(tag)] for tag in bookTags ]
+	return (books, bookTags)
+
+def excluded_book_tags(bookTags):
+	"""Return the tags of the books left out of an export of those with bookTags."""
+	return [ tag for tag in BOOK_TAGS if tag not in bookTags ]
+
+def parser_version(parser_class, bookTags):
+	"""Return a hash of the source of the parser modules and the book tags, which decide what a file exports as.
+
+	This module is included too, since the hash of each record is taken as the file is exported.
+	"""
+	digest = hashlib.sha1()
+	for module in (base, sys.modules[parser_class.__module__], sys.modules[__name__]):
+		source_filename = os.path.splitext(module.__file__)[0] + ".py"
+		with open(source_filename, 'rb') as source_file:
+			digest.update(source_file.read())
+	digest.update("\0".join(bookTags))
+	return digest.hexdigest()
+
+def file_key(version, filename):
+	"""Return a hash of the contents of filename and the parser version, which changes with what it exports as."""
+	digest = hashlib.sha1(version)
+	with open(filename, 'rb') as f:
+		digest.update(f.read())
+	return digest.hexdigest()
+
+class ExportCache(object):
+	"""On-disk cache of exported objects.
+
+	Entries are keyed by a hash of the file contents, the book tags, and the source of the parser
+	modules, so changing any of those is enough to invalidate them.
+	"""
+
+	def __init__(self, path, parser_class, bookTags):
+		self.path = path
+		self.version = parser_version(parser_class, bookTags)
+
+	def key(self, filename):
+		return file_key(self.version, filename)
+
+	def entry_path(self, key):
+		return os.path.join(self.path, key[:2], key)
+
+	def has(self, key):
+		return os.path.exists(self.entry_path(key))
+
+	def get(self, key):
 		try:
-			try:
-				parser.parse()
-				monsters.append(parser.object())
-			except base.ParseException, e:
-				print >>sys.stderr, "%s:%d:%s" % (e.filename, e.lineno, e.message)
+			with open(self.entry_path(key), 'rb') as f:
+				return cPickle.load(f)
+		except (IOError, EOFError, cPickle.UnpicklingError):
+			return None
+
+	def set(self, key, result):
+		path = self.entry_path(key)
+		dirname = os.path.dirname(path)
+		if not os.path.isdir(dirname):
+			os.makedirs(dirname)
+
+		# Write to a temporary file and rename so an interrupted export never leaves a bad entry.
+		(fd, temp_path) = tempfile.mkstemp(dir=dirname)
+		with os.fdopen(fd, 'wb') as f:
+			cPickle.dump(result, f, cPickle.HIGHEST_PROTOCOL)
+		os.rename(temp_path, path)
+
+
+def export_file(args):
+	(parser_class, filename, bookTags) = args
+
+	try:
+		parser = parser_class(filename, bookTags=bookTags, excludedBookTags=excluded_book_tags(bookTags))
+		try:
+			parser.parse()
+			# Built and hashed here so it's done in the workers, and kept in the cache as it's written.
+			return (exported_object(parser.export()), None)
 		finally:
 			parser.close()
+	except base.SkipFile:
+		# Nothing to export, and nothing wrong.
+		return (None, None)
+	except base.ParseException, e:
+		# ParseException doesn't survive pickling, so hand back the location and message instead.
+		return (None, (e.lineno, e.message))
+
+def export_files(parser_class, filenames, bookTags, pool=None, cache=None):
+	"""Generate the exported object for each file, in order, printing errors as they're reached.
+
+	Files only in books left out of the export are skipped.
+	"""
+	tasks = [ (parser_class, filename, bookTags) for filename in filenames ]
+
+	keys = [ None ] * len(filenames)
+	cached = [ False ] * len(filenames)
+	if cache is not None:
+		keys = [ cache.key(filename) for filename in filenames ]
+		cached = [ cache.has(key) for key in keys ]
+
+	misses = [ task for task, hit in itertools.izip(tasks, cached) if not hit ]
+	if pool is not None:
+		# imap() keeps results in the same order as the serial run.
+		parsed = pool.imap(export_file, misses)
+	else:
+		parsed = itertools.imap(export_file, misses)
+
+	for task, key, hit in itertools.izip(tasks, keys, cached):
+		result = None
+		if hit:
+			result = cache.get(key)
+			if result is None:
+				# Entry went bad since we checked, just parse it here.
+				result = export_file(task)
+				cache.set(key, result)
+		else:
+			result = parsed.next()
+			if cache is not None:
+				cache.set(key, result)
+
+		(object, error) = result
+		if error is not None:
+			(lineno, message) = error
+			print >>sys.stderr, "%s:%d:%s" % (task[1], lineno, message)
+		elif object is not None:
+			yield object
 
-	spells = []
-	for filename in base.local_files('Spells'):
-		parser = spell.SpellExporter(filename, bookTags=bookTags)
+class PlistBackend(object):
+	"""Fills an exporter from the record of a file parsed for other outputs as well."""
+
+	def __init__(self, parser_class, bookTags):
+		self.parser_class = parser_class
+		self.bookTags = bookTags
+
+	def convert(self, filename, record):
+		parser = self.parser_class(filename, bookTags=self.bookTags, lines=[])
+		record.replay(parser)
+		return exported_object(parser.export())
+
+def export_record(args):
+	"""Parse a file once, and return what each of the backends makes of it."""
+	(recorder_class, filename, backends) = args
+
+	try:
+		parser = recorder_class(filename)
 		try:
-			try:
-				parser.parse()
-				spells.append(parser.object())
-			except base.ParseException, e:
-				print >>sys.stderr, "%s:%d:%s" % (e.filename, e.lineno, e.message)
+			parser.parse()
 		finally:
 			parser.close()
 
-	rootObject = {
-		"books": books,
-		"monsters": monsters,
-		"spells": spells,
-		"version": int(time.mktime(time.gmtime())),
+		return ([ backend.convert(filename, parser.record) for backend in backends ], None)
+	except base.ParseException, e:
+		return (None, (e.lineno, e.message))
+
+def export_records(recorder_class, filenames, backends, pool=None, errors=None):
+	"""Generate the list of outputs of the backends for each file, in order, printing errors as they're reached.
+
+	The filename of each file that fails is added to errors, if given.
+	"""
+	tasks = [ (recorder_class, filename, backends) for filename in filenames ]
+	if pool is not None:
+		results = pool.imap(export_record, tasks)
+	else:
+		results = itertools.imap(export_record, tasks)
+
+	for filename, (outputs, error) in itertools.izip(filenames, results):
+		if error is not None:
+			(lineno, message) = error
+			print >>sys.stderr, "%s:%d:%s" % (filename, lineno, message)
+			if errors is not None:
+				errors.append(filename)
+		else:
+			yield outputs
+
+
+def format_real(value):
+	# Fixed precision, so challenge ratings and alignment weights are always written the same way.
+	text = ("%.6f" % value).rstrip("0")
+	if text.endswith("."):
+		text += "0"
+	return text
+
+def canonical_value(value):
+	"""Return an exported value with each dictionary as a list of its items sorted by key, and reals formatted.
+
+	json only uses its C encoder when it isn't sorting keys, and that writes reals its own way, so both are
+	done here instead.
+	"""
+	if isinstance(value, dict):
+		return [ [ key, canonical_value(value[key]) ] for key in sorted(value.keys()) ]
+	elif isinstance(value, (list, tuple)):
+		return [ canonical_value(item) for item in value ]
+	elif isinstance(value, float):
+		return format_real(value)
+	else:
+		return value
+
+def canonical_form(value):
+	"""Return a deterministic serialization of an exported value, with sorted keys and fixed reals."""
+	return json.dumps(canonical_value(value), separators=(",", ":"))
+
+def record_hash(object):
+	"""Return a SHA-1 hash of the content of an exported record, ignoring any hash it already carries.
+
+	Records read back from a plist hash the same as freshly exported ones, so the two can be compared.
+	"""
+	if "hash" in object:
+		object = dict((key, value) for key, value in object.items() if key != "hash")
+	return hashlib.sha1(canonical_form(object)).hexdigest()
+
+def exported_object(record):
+	"""Return the object a parsed record is written out as, along with its hash.
+
+	This is the only place records are hashed; everything after passes the object along as it is.
+	"""
+	object = record.object()
+	object["hash"] = record_hash(object)
+	return object
+
+class Fingerprinter(object):
+	"""Passes exported objects through, fingerprinting the section as a whole from the hash each carries."""
+
+	def __init__(self, objects):
+		self.objects = objects
+		self.digest = hashlib.sha1()
+
+	def __iter__(self):
+		for object in self.objects:
+			self.digest.update(object["hash"])
+			yield object
+
+	def hexdigest(self):
+		return self.digest.hexdigest()
+
+def content_version(books, monsters, spells):
+	"""Return the export version, derived from the books and the fingerprints of both sections.
+
+	The importer compares it as an integer, so this is the first 60 bits of the hash.
+	"""
+	digest = hashlib.sha1(canonical_form(books))
+	digest.update(monsters.hexdigest())
+	digest.update(spells.hexdigest())
+	return int(digest.hexdigest()[:15], 16)
+
+def delta_records(objects, previous_objects):
+	"""Compare exported records against those of a previous export.
+
+	Records are matched by name, or by one of their "was" names when renamed. Returns a dictionary of
+	the added and changed records, each with its content hash, and the names of the removed ones.
+	"""
+	previous = {}
+	for previous_object in previous_objects:
+		previous.setdefault(previous_object["name"], []).append(previous_object)
+
+	matched = set()
+	added = []
+	changed = []
+	for object in objects:
+		# names begins with the current name, followed by any older ones.
+		for name in object["names"]:
+			candidates = [ candidate for candidate in previous.get(name, []) if id(candidate) not in matched ]
+			if len(candidates):
+				matched.add(id(candidates[0]))
+				if record_hash(candidates[0]) != object["hash"]:
+					changed.append(object)
+				break
+		else:
+			added.append(object)
+
+	removed = [ previous_object["name"] for previous_object in previous_objects
+				if id(previous_object) not in matched ]
+
+	return {
+		"added": added,
+		"changed": changed,
+		"removed": removed,
 	}
 
-	print plistlib.writePlistToString(rootObject)
+
+CONTROL_CHARACTERS = re.compile(r"[\x00-\x08\x0b\x0c\x0e-\x1f]")
+
+def escape_text(text):
+	"""Escape and encode a string or key for the export plist, as plistlib does."""
+	if CONTROL_CHARACTERS.search(text) is not None:
+		raise ValueError("strings can't contains control characters; use plistlib.Data instead")
+	text = text.replace("\r\n", "\n").replace("\r", "\n")
+	return text.replace("&", "&amp;").replace("<", "&lt;").replace(">", "&gt;").encode("utf-8")
+
+class ExportWriter(plistlib.PlistWriter):
+	"""Writes the export plist a record at a time, rather than building the whole tree in memory.
+
+	Keys of the root dictionary must be written in sorted order to match plistlib's own output.
+	"""
+
+	def writeValue(self, value):
+		# The types records are made of are written here directly, rather than through the several calls
+		# plistlib makes for every value; the output is the same apart from reals.
+		indent = self.indentLevel * self.indent
+		if isinstance(value, (str, unicode)):
+			self.file.write("%s<string>%s</string>\n" % (indent, escape_text(value)))
+		elif isinstance(value, bool):
+			self.file.write(indent + ("<true/>\n" if value else "<false/>\n"))
+		elif isinstance(value, (int, long)):
+			self.file.write("%s<integer>%d</integer>\n" % (indent, value))
+		elif isinstance(value, float):
+			self.file.write("%s<real>%s</real>\n" % (indent, format_real(value)))
+		elif isinstance(value, dict):
+			self.file.write(indent + "<dict>\n")
+			self.indentLevel += 1
+			key_indent = indent + self.indent
+			for key in sorted(value.keys()):
+				self.file.write("%s<key>%s</key>\n" % (key_indent, escape_text(key)))
+				self.writeValue(value[key])
+			self.indentLevel -= 1
+			self.file.write(indent + "</dict>\n")
+		elif isinstance(value, (list, tuple)):
+			self.file.write(indent + "<array>\n")
+			self.indentLevel += 1
+			for item in value:
+				self.writeValue(item)
+			self.indentLevel -= 1
+			self.file.write(indent + "</array>\n")
+		else:
+			plistlib.PlistWriter.writeValue(self, value)
+
+	def begin(self):
+		self.writeln("<plist version=\"1.0\">")
+		self.beginElement("dict")
+
+	def end(self):
+		self.endElement("dict")
+		self.writeln("</plist>")
+		# Data.plist has always been written with print, which adds an extra newline.
+		self.writeln("")
+
+	def write_item(self, key, value):
+		self.simpleElement("key", key)
+		self.writeValue(value)
+
+	def begin_array(self, key):
+		self.simpleElement("key", key)
+		self.beginElement("array")
+
+	def end_array(self):
+		self.endElement("array")
+
+	def write_array(self, key, values):
+		self.begin_array(key)
+		for value in values:
+			self.writeValue(value)
+		self.end_array()
+
+
+def home_book(object):
+	"""Return the index of the book a record belongs to when sharded, the first of its sources."""
+	return object["sources"][0]["book"]
+
+class ShardWriter(object):
+	"""Writes the export as one plist per book, with a manifest of the SHA-1 hash of each.
+
+	Each record is written to the shard of its home book, so a change to a source file only changes the
+	shard of that book. The version is kept in the manifest alone, so unchanged shards keep their hash.
+	Call write() with the records, then write_manifest() once the version is known.
+	"""
+
+	def __init__(self, path, books, bookTags):
+		self.path = path
+		self.books = books
+		self.bookTags = bookTags
+
+	def shard_filename(self, tag):
+		return tag + ".plist"
+
+	def write(self, monsters, spells):
+		if not os.path.isdir(self.path):
+			os.makedirs(self.path)
+
+		# Write alongside and rename into place so readers never see a partial file.
+		paths = [ os.path.join(self.path, self.shard_filename(tag)) for tag in self.bookTags ]
+		files = []
+		counts = [ { "monsters": 0, "spells": 0 } for tag in self.bookTags ]
+		try:
+			for path in paths:
+				files.append(open(path + ".tmp", 'wb'))
+
+			writers = [ ExportWriter(f) for f in files ]
+			for writer in writers:
+				writer.begin()
+
+			for key, objects in (("monsters", monsters), ("spells", spells)):
+				for writer in writers:
+					writer.begin_array(key)
+				for object in objects:
+					book = home_book(object)
+					writers[book].writeValue(object)
+					counts[book][key] += 1
+				for writer in writers:
+					writer.end_array()
+
+			for writer in writers:
+				writer.end()
+		except BaseException:
+			# Don't leave the partial shards behind, including on KeyboardInterrupt.
+			for f in files:
+				f.close()
+				os.remove(f.name)
+			raise
+
+		for f in files:
+			f.close()
+
+		self.shards = []
+		for tag, path, count in itertools.izip(self.bookTags, paths, counts):
+			os.rename(path + ".tmp", path)
+			with open(path, 'rb') as f:
+				digest = hashlib.sha1(f.read()).hexdigest()
+
+			self.shards.append({
+				"tag": tag,
+				"file": self.shard_filename(tag),
+				"hash": digest,
+				"monsters": count["monsters"],
+				"spells": count["spells"],
+			})
+
+	def write_manifest(self, version):
+		manifest = {
+			"books": self.books,
+			"shards": self.shards,
+			"version": version,
+		}
+
+		manifest_path = os.path.join(self.path, "Manifest.plist")
+		try:
+			plistlib.writePlist(manifest, manifest_path + ".tmp")
+		except BaseException:
+			if os.path.exists(manifest_path + ".tmp"):
+				os.remove(manifest_path + ".tmp")
+			raise
+		os.rename(manifest_path + ".tmp", manifest_path)
+
+
+# Files each worker parses into a part of a JSON Lines export at a time.
+JSONL_BATCH_SIZE = 250
+
+def jsonl_line(record_type, object):
+	"""Return an exported object as a line of JSON Lines, marked with the type of record it is."""
+	object = dict(object, type=record_type)
+	return json.dumps(object, ensure_ascii=False, sort_keys=True, separators=(",", ":")).encode('utf8') + "\n"
+
+def write_jsonl(output, books, version, parts):
+	"""Write a JSON Lines export: a header with the books and version, then the lines of each file in parts.
+
+	Every line stands alone, so parts can be split or concatenated freely after the header.
+	"""
+	output.write(jsonl_line("header", { "books": books, "version": version }))
+	for part in parts:
+		shutil.copyfileobj(part, output)
+
+def export_jsonl_part(args):
+	"""Export a batch of files as JSON Lines to a part file, returning the hash or error of each."""
+	(parser_class, filenames, bookTags, record_type, part_path) = args
+
+	results = []
+	with open(part_path, 'wb') as part:
+		for filename in filenames:
+			(object, error) = export_file((parser_class, filename, bookTags))
+			if object is None:
+				results.append((None, error))
+				continue
+
+			part.write(jsonl_line(record_type, object))
+			results.append((object["hash"], None))
+
+	return results
+
+def export_jsonl_parts(options, pool):
+	"""Export JSON Lines with each worker writing its batches to part files, concatenated in order at the end.
+
+	Encoding the records is spread across the workers as well as parsing them, and the result is the same as
+	writing them all in this process.
+	"""
+	if options.output is not None:
+		temp_path = options.output + ".tmp"
+		part_dir = tempfile.mkdtemp(dir=os.path.dirname(os.path.abspath(options.output)))
+	else:
+		part_dir = tempfile.mkdtemp()
+
+	try:
+		tasks = []
+		for record_type, parser_class, file_type in (("monster", monster.MonsterExporter, 'Monsters'),
+													 ("spell", spell.SpellExporter, 'Spells')):
+			filenames = base.local_files(file_type, options.files)
+			for start in range(0, len(filenames), JSONL_BATCH_SIZE):
+				part_path = os.path.join(part_dir, "%s-%d.jsonl" % (record_type, start))
+				tasks.append((parser_class, filenames[start:start + JSONL_BATCH_SIZE], options.bookTags,
+							  record_type, part_path))
+
+		# Fingerprint the sections from the hashes the workers hand back, as Fingerprinter would.
+		digests = { "monster": hashlib.sha1(), "spell": hashlib.sha1() }
+		for task, results in itertools.izip(tasks, pool.imap(export_jsonl_part, tasks)):
+			(parser_class, filenames, bookTags, record_type, part_path) = task
+			for filename, (hash, error) in itertools.izip(filenames, results):
+				if error is not None:
+					(lineno, message) = error
+					print >>sys.stderr, "%s:%d:%s" % (filename, lineno, message)
+				elif hash is not None:
+					digests[record_type].update(hash)
+
+		version = content_version(options.books, digests["monster"], digests["spell"])
+
+		if options.output is not None:
+			output = open(temp_path, 'wb')
+		else:
+			output = sys.stdout
+
+		def parts():
+			for task in tasks:
+				with open(task[4], 'rb') as part:
+					yield part
+
+		try:
+			write_jsonl(output, options.books, version, parts())
+		except BaseException:
+			# As in write_export, don't leave the partial file behind.
+			if options.output is not None:
+				output.close()
+				os.remove(temp_path)
+			raise
+	finally:
+		shutil.rmtree(part_dir)
+
+	if options.output is not None:
+		output.close()
+		os.rename(temp_path, options.output)
+
+
+def export_database(options, pool):
+	"""Bring the SQLite database at options.sqlite up to date, only exporting the files that changed since."""
+	import database
+
+	db = database.Database(options.sqlite)
+	# Records are stored as the schema says, so a change to it means exporting them again.
+	fingerprint = database.schema_fingerprint()
+	try:
+		db.begin(options.books, options.bookTags)
+		# Whatever's left here once the current files are gone through was removed.
+		stored_keys = db.file_keys()
+
+		for parser_class, file_type, add_record in ((monster.MonsterExporter, 'Monsters', db.add_monster),
+													(spell.SpellExporter, 'Spells', db.add_spell)):
+			version = parser_version(parser_class, options.bookTags) + fingerprint
+			changed = []
+			for filename in base.local_files(file_type, options.files):
+				filename = os.path.normpath(filename)
+				key = file_key(version, filename)
+				if stored_keys.pop(filename, None) != key:
+					changed.append((filename, key))
+
+			tasks = [ (parser_class, filename, options.bookTags) for filename, key in changed ]
+			if pool is not None:
+				results = pool.imap(export_file, tasks)
+			else:
+				results = itertools.imap(export_file, tasks)
+
+			for (filename, key), (object, error) in itertools.izip(changed, results):
+				db.remove_file(filename)
+				if error is not None:
+					# Left out of the database, so it's exported and reported again next time.
+					(lineno, message) = error
+					print >>sys.stderr, "%s:%d:%s" % (filename, lineno, message)
+					continue
+
+				# Files only in books left out are kept with no records, so they're not read again until they change.
+				file_id = db.add_file(filename, key)
+				if object is not None:
+					add_record(file_id, object)
+
+		for filename in stored_keys:
+			db.remove_file(filename)
+
+		db.commit()
+	finally:
+		db.close()
+
+
+class WarmExport(object):
+	"""Exported objects of the files of one type, kept in memory so only the files that change are parsed again."""
+
+	def __init__(self, parser_class, file_type, files, bookTags, pool=None):
+		self.parser_class = parser_class
+		self.file_type = file_type
+		self.files = files
+		self.bookTags = bookTags
+
+		self.filenames = self.list_files()
+		tasks = [ (parser_class, filename, bookTags) for filename in self.filenames ]
+		if pool is not None:
+			results = pool.imap(export_file, tasks)
+		else:
+			results = itertools.imap(export_file, tasks)
+		self.results = dict(itertools.izip(self.filenames, results))
+
+	def list_files(self):
+		import watch
+
+		return [ os.path.normpath(filename) for filename in base.local_files(self.file_type, self.files)
+				 if watch.is_source_file(filename) ]
+
+	def directories(self):
+		directories = set(os.path.dirname(filename) for filename in self.filenames)
+		if not len(self.files):
+			# Watch the type directory too, to notice new books.
+			basedir = os.path.normpath(os.path.join(os.path.dirname(sys.argv[0]), self.file_type))
+			directories.add(basedir)
+			directories.update(os.path.join(basedir, name) for name in os.listdir(basedir)
+							   if os.path.isdir(os.path.join(basedir, name)))
+		return directories
+
+	def update(self, paths):
+		"""Parse the changed files among paths again.
+
+		Returns the (filename, result) of each, with a result of None for files that were removed.
+		"""
+		# Only those in this export's directories; the other type's files are another export's concern.
+		directories = self.directories()
+		paths = [ path for path in map(os.path.normpath, paths) if os.path.dirname(path) in directories ]
+
+		updated = []
+		# Only list the directories again if a file came or went.
+		if any(path not in self.results and os.path.exists(path) for path in paths) or \
+		   any(path in self.results and not os.path.exists(path) for path in paths):
+			self.filenames = self.list_files()
+			for filename in set(self.results.keys()) - set(self.filenames):
+				del self.results[filename]
+				updated.append((filename, None))
+
+		for path in paths:
+			if path in self.filenames:
+				self.results[path] = export_file((self.parser_class, path, self.bookTags))
+				updated.append((path, self.results[path]))
+		return updated
+
+	def errors(self):
+		for filename in self.filenames:
+			(object, error) = self.results[filename]
+			if error is not None:
+				yield (filename, error)
+
+	def objects(self):
+		for filename in self.filenames:
+			(object, error) = self.results[filename]
+			if object is not None:
+				yield object
+
+
+def write_export(options, monsters, spells, previous=None):
+	"""Write the export in the form chosen by options, from generators of the exported monsters and spells."""
+	monsters = Fingerprinter(monsters)
+	spells = Fingerprinter(spells)
+
+	if options.shards is not None:
+		shard_writer = ShardWriter(options.shards, options.books, options.bookTags)
+		shard_writer.write(monsters, spells)
+		shard_writer.write_manifest(content_version(options.books, monsters, spells))
+		return
+
+	if options.output is not None:
+		# Write alongside and rename into place so readers never see a partial file.
+		temp_path = options.output + ".tmp"
+		output = open(temp_path, 'wb')
+	else:
+		output = sys.stdout
+
+	try:
+		if options.jsonl:
+			# The version depends on every record, so spool them until it's known and the header can go first.
+			spool = tempfile.TemporaryFile()
+			try:
+				for record_type, objects in (("monster", monsters), ("spell", spells)):
+					for object in objects:
+						spool.write(jsonl_line(record_type, object))
+				spool.seek(0)
+				write_jsonl(output, options.books, content_version(options.books, monsters, spells), [ spool ])
+			finally:
+				spool.close()
+		elif options.store:
+			import store
+
+			store_writer = store.StoreWriter(output)
+			for record_type, objects in (("monster", monsters), ("spell", spells)):
+				for object in objects:
+					store_writer.add(record_type, object)
+			store_writer.finish(options.books, content_version(options.books, monsters, spells))
+		elif previous is not None:
+			monster_delta = delta_records(monsters, previous["monsters"])
+			spell_delta = delta_records(spells, previous["spells"])
+			# Only once both sections have been gone through.
+			version = content_version(options.books, monsters, spells)
+
+			rootObject = {
+				"books": options.books,
+				"monsters": monster_delta,
+				"spells": spell_delta,
+				"previousVersion": previous["version"],
+				"version": version,
+			}
+
+			if options.binary:
+				import bplist
+
+				bplist.BinaryPlistWriter(output).write(rootObject)
+			else:
+				writer = ExportWriter(output)
+				writer.begin()
+				for key in sorted(rootObject.keys()):
+					writer.write_item(key, rootObject[key])
+				writer.end()
+		elif options.binary:
+			import bplist
+
+			# The offset table and object references need the whole tree, so this can't be streamed.
+			monster_objects = list(monsters)
+			spell_objects = list(spells)
+			version = content_version(options.books, monsters, spells)
+
+			rootObject = {
+				"books": options.books,
+				"monsters": monster_objects,
+				"monstersHash": monsters.hexdigest(),
+				"spells": spell_objects,
+				"spellsHash": spells.hexdigest(),
+				"version": version,
+			}
+
+			bplist.BinaryPlistWriter(output).write(rootObject)
+		else:
+			# Each section's hash follows it, and the version comes last, so they can still be streamed.
+			writer = ExportWriter(output)
+			writer.begin()
+			writer.write_item("books", options.books)
+			writer.write_array("monsters", monsters)
+			writer.write_item("monstersHash", monsters.hexdigest())
+			writer.write_array("spells", spells)
+			writer.write_item("spellsHash", spells.hexdigest())
+			writer.write_item("version", content_version(options.books, monsters, spells))
+			writer.end()
+	except BaseException:
+		# Failed or interrupted part way, so don't leave the partial file behind.
+		if options.output is not None:
+			output.close()
+			os.remove(temp_path)
+		raise
+
+	if options.output is not None:
+		output.close()
+		os.rename(temp_path, options.output)
+
+def watch_export(options, previous, pool):
+	"""Export, then export again each time a source file changes, only parsing the files that did."""
+	import watch
+
+	exports = [
+		WarmExport(monster.MonsterExporter, 'Monsters', options.files, options.bookTags, pool),
+		WarmExport(spell.SpellExporter, 'Spells', options.files, options.bookTags, pool),
+	]
+	for warm_export in exports:
+		for filename, (lineno, message) in warm_export.errors():
+			print >>sys.stderr, "%s:%d:%s" % (filename, lineno, message)
+	write_export(options, exports[0].objects(), exports[1].objects(), previous)
+
+	watcher = watch.watcher()
+	try:
+		for warm_export in exports:
+			for directory in warm_export.directories():
+				watcher.add(directory)
+
+		while True:
+			paths = [ path for path in watcher.wait() if watch.is_source_file(path) ]
+			start = time.time()
+
+			updated = []
+			for warm_export in exports:
+				updated += warm_export.update(paths)
+				for directory in warm_export.directories():
+					watcher.add(directory)
+			if not len(updated):
+				continue
+
+			# Report problems before writing, which takes a while for a large export.
+			for filename, result in updated:
+				if result is not None and result[1] is not None:
+					(lineno, message) = result[1]
+					print >>sys.stderr, "%s:%d:%s" % (filename, lineno, message)
+
+			write_export(options, exports[0].objects(), exports[1].objects(), previous)
+			print >>sys.stderr, "Exported %d changed files in %d ms" % (len(updated), (time.time() - start) * 1000)
+	finally:
+		watcher.close()
+
+def export_with_fight_club(options, previous, pool):
+	"""Export, and write the Fight Club compendium from the same parse of each monster."""
+	import m2fc
+
+	backends = [ PlistBackend(monster.MonsterExporter, options.bookTags), m2fc.FightClubBackend() ]
+	compendium = m2fc.MonsterSorter(10000)
+	errors = []
+	try:
+		def monsters():
+			for object, (name, xml) in export_records(monster.MonsterRecorder,
+													  base.local_files('Monsters', options.files), backends, pool,
+													  errors):
+				compendium.add(name, xml)
+				yield object
+
+		spells = export_files(spell.SpellExporter, base.local_files('Spells', options.files), options.bookTags, pool)
+		write_export(options, monsters(), spells, previous)
+
+		# As m2fc.py does, report every monster that fails, but don't write a compendium missing some of them.
+		if len(errors):
+			sys.exit(1)
+
+		# Write alongside and rename into place so readers never see a partial file.
+		with open(options.fight_club + ".tmp", 'wb') as output:
+			m2fc.write_compendium(output, compendium)
+		os.rename(options.fight_club + ".tmp", options.fight_club)
+	finally:
+		compendium.close()
+
+def main():
+	argparser = argparse.ArgumentParser(description="Export monsters and spells to a plist.")
+	argparser.add_argument("-j", "--jobs", type=int, default=1,
+						   help="number of worker processes to parse files with")
+	argparser.add_argument("--cache", metavar="DIR",
+						   help="directory to cache exported objects in, so only changed files are parsed")
+	argparser.add_argument("-o", "--output", metavar="PATH",
+						   help="file to write the plist to, instead of standard output")
+	argparser.add_argument("--shards", metavar="DIR",
+						   help="write a plist for each book to this directory, along with a manifest of their hashes")
+	argparser.add_argument("--delta", metavar="PLIST",
+						   help="previously shipped export to compare against, writing only the added, changed, "
+						   "and removed records")
+	argparser.add_argument("--fight-club", metavar="PATH",
+						   help="also write the monsters as a Fight Club compendium, parsing each file once for both")
+	argparser.add_argument("--store", action="store_true",
+						   help="write a record store, indexed by name for looking up single records with store.py")
+	argparser.add_argument("--sqlite", metavar="PATH",
+						   help="bring an SQLite database of the export up to date, with full-text search over "
+						   "the traits, actions and spells, only exporting the files that changed since")
+	argparser.add_argument("--binary", action="store_true",
+						   help="write a binary plist, sharing repeated strings and numbers")
+	argparser.add_argument("--jsonl", action="store_true",
+						   help="write JSON Lines instead of a plist: a header with the books and version, then "
+						   "one monster or spell per line, marked by its \"type\"")
+	argparser.add_argument("--mmap", action="store_true",
+						   help="map source files into memory rather than reading them")
+	argparser.add_argument("--profile", action="store_true",
+						   help="time each parser handler and print a table of them to standard error, "
+						   "parsing every file in this process")
+	argparser.add_argument("--watch", action="store_true",
+						   help="keep running, exporting again whenever a source file changes")
+	argparser.add_argument("--books", metavar="TAGS",
+						   help="comma-separated tags of the books to export, such as phb,mm,dmg; files with no "
+						   "source in them are skipped once their header is read")
+	argparser.add_argument("files", nargs="*",
+						   help="files to export, instead of the Monsters and Spells directories")
+	options = argparser.parse_args()
+
+	if options.shards is not None and (options.output is not None or options.binary or options.delta is not None):
+		argparser.error("--shards can't be combined with --output, --binary or --delta")
+	if options.watch and options.output is None and options.shards is None:
+		argparser.error("--watch needs --output or --shards to write to")
+	if options.watch and options.cache is not None:
+		argparser.error("--watch keeps exported objects in memory, and can't be combined with --cache")
+	if options.fight_club is not None and (options.watch or options.cache is not None):
+		argparser.error("--fight-club can't be combined with --watch or --cache")
+	if options.jsonl and (options.shards is not None or options.binary or options.delta is not None):
+		argparser.error("--jsonl can't be combined with --shards, --binary or --delta")
+	if options.store and options.output is None:
+		argparser.error("--store needs --output to write to, since its header is written last")
+	if options.store and (options.shards is not None or options.binary or options.delta is not None or
+						  options.jsonl):
+		argparser.error("--store can't be combined with --shards, --binary, --delta or --jsonl")
+	if options.sqlite is not None and (options.output is not None or options.shards is not None or options.binary or
+									   options.delta is not None or options.jsonl or options.store or options.watch or
+									   options.fight_club is not None or options.cache is not None):
+		argparser.error("--sqlite keeps track of what changed itself, and can't be combined with other outputs, "
+						"--watch or --cache")
+
+	if options.books is not None and options.fight_club is not None:
+		argparser.error("--books can't be combined with --fight-club")
+
+	try:
+		(options.books, options.bookTags) = select_books(options.books)
+	except ValueError, e:
+		argparser.error(e.message)
+
+	previous = None
+	if options.delta is not None:
+		import bplist
+		from xml.parsers.expat import ExpatError
+
+		# Either an XML or a binary export.
+		try:
+			previous = bplist.read_plist(options.delta)
+		except IOError, e:
+			argparser.error("can't read %s: %s" % (options.delta, e.strerror))
+		except (bplist.BinaryPlistError, ExpatError), e:
+			argparser.error("%s: %s" % (options.delta, e))
+
+	base.Parser.use_mmap = options.mmap
+	if options.profile:
+		base.Parser.profile = base.Profile()
+
+	pool = None
+	if options.jobs > 1 and not options.profile:
+		import multiprocessing
+
+		pool = multiprocessing.Pool(options.jobs)
+
+	monster_cache = None
+	spell_cache = None
+	if options.cache is not None:
+		monster_cache = ExportCache(options.cache, monster.MonsterExporter, options.bookTags)
+		spell_cache = ExportCache(options.cache, spell.SpellExporter, options.bookTags)
+
+	try:
+		if options.watch:
+			watch_export(options, previous, pool)
+		elif options.fight_club is not None:
+			export_with_fight_club(options, previous, pool)
+		elif options.sqlite is not None:
+			export_database(options, pool)
+		elif options.jsonl and pool is not None and options.cache is None:
+			export_jsonl_parts(options, pool)
+		else:
+			monsters = export_files(monster.MonsterExporter, base.local_files('Monsters', options.files),
+									options.bookTags, pool, monster_cache)
+			spells = export_files(spell.SpellExporter, base.local_files('Spells', options.files),
+								  options.bookTags, pool, spell_cache)
+			write_export(options, monsters, spells, previous)
+	except KeyboardInterrupt:
+		if not options.watch:
+			raise
+	finally:
+		if pool is not None:
+			pool.close()
+			pool.join()
+
+	if options.profile:
+		base.Parser.profile.report(sys.stderr)
 
 if __name__ == "__main__":
 	main()
@@ -0,0 +1,122 @@
+#!/usr/bin/env python
+# -*- coding: utf8 -*-
+
+import argparse
+import itertools
+import multiprocessing
+import os
+import sys
+
+import base
+import export
+import monster
+import spell
+
+class ErrorCollector(object):
+	"""Mixin for parsers that records bad lines and fields and carries on, rather than stopping.
+
+	Errors in the structure of the file still end the parse, since there's no telling where the
+	following lines belong, but those are recorded along with the rest.
+	"""
+
+	def __init__(self, *args, **kwargs):
+		self.errors = []
+		super(ErrorCollector, self).__init__(*args, **kwargs)
+
+		for name in dir(self):
+			if name.startswith("handle_"):
+				setattr(self, name, self.collect_errors(getattr(self, name)))
+
+	def collect_errors(self, handler):
+		def collecting_handler(*args):
+			try:
+				handler(*args)
+			except base.ParseException, e:
+				self.errors.append(e)
+		return collecting_handler
+
+	def check_line(self, line):
+		try:
+			super(ErrorCollector, self).check_line(line)
+		except base.ParseException, e:
+			self.errors.append(e)
+
+class MonsterLinter(ErrorCollector, monster.MonsterExporter):
+	pass
+
+class SpellLinter(ErrorCollector, spell.SpellExporter):
+	pass
+
+
+def linter_for(filename):
+	parts = os.path.abspath(filename).split(os.sep)
+	if "Spells" in parts:
+		return SpellLinter
+	else:
+		return MonsterLinter
+
+def lint_file(args):
+	(linter_class, filename) = args
+
+	try:
+		parser = linter_class(filename, bookTags=export.BOOK_TAGS)
+	except base.ParseException, e:
+		return [ (e.lineno, e.message) ]
+
+	try:
+		try:
+			parser.parse()
+			parser.validate()
+		except base.ParseException, e:
+			parser.errors.append(e)
+		except Exception, e:
+			# A bug in a handler, or a field relying on one already reported as bad, such as Senses on WIS.
+			# Report it like any other error, so one file can't stop the whole run.
+			parser.errors.append(parser.error("%s: %s" % (type(e).__name__, e)))
+	finally:
+		parser.close()
+
+	errors = [ (e.lineno, e.message) for e in parser.errors ]
+	errors.sort(key=lambda error: error[0])
+	return errors
+
+def main():
+	argparser = argparse.ArgumentParser(
+		description="Check monsters and spells for errors, reporting all of them rather than the first.")
+	argparser.add_argument("-j", "--jobs", type=int, default=multiprocessing.cpu_count(),
+						   help="number of worker processes to check files with")
+	argparser.add_argument("files", nargs="*",
+						   help="files to check, instead of the Monsters and Spells directories")
+	options = argparser.parse_args()
+
+	if len(options.files):
+		tasks = [ (linter_for(filename), filename) for filename in options.files ]
+	else:
+		tasks = [ (MonsterLinter, filename) for filename in base.local_files('Monsters', []) ]
+		tasks += [ (SpellLinter, filename) for filename in base.local_files('Spells', []) ]
+
+	pool = None
+	if options.jobs > 1:
+		pool = multiprocessing.Pool(options.jobs)
+
+	try:
+		if pool is not None:
+			results = pool.imap(lint_file, tasks)
+		else:
+			results = itertools.imap(lint_file, tasks)
+
+		error_count = 0
+		for (linter_class, filename), errors in itertools.izip(tasks, results):
+			for lineno, message in errors:
+				print "%s:%d:%s" % (filename, lineno, message)
+			error_count += len(errors)
+	finally:
+		if pool is not None:
+			pool.close()
+			pool.join()
+
+	if error_count:
+		sys.exit(1)
+
+if __name__ == "__main__":
+	main()
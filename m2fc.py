@@ -1,9 +1,15 @@
 #!/usr/bin/env python
 # -*- coding: utf8 -*-
 
-import re
+import argparse
+import cPickle
+import heapq
+import itertools
+import multiprocessing
 import sys
+import tempfile
 
+import base
 import monster
 
 from xml.sax.saxutils import escape
@@ -23,31 +29,39 @@ class FightClubConverter(monster.MonsterParser):
 		"Gargantuan": "G",
 	}
 
-	PP_RE = re.compile(r'^(?:(.*)(?:, ))?passive Perception (\d+)$')
+	PP_RE = base.lazy_compile(r'^(?:(.*)(?:, ))?passive Perception (\d+)$')
 
-	CR_RE = re.compile(r'^([\d/]+)')
+	CR_RE = base.lazy_compile(r'^([\d/]+)')
 
-	HIT_RE = re.compile('\+(\d+) to hit')
-	DICE_RE = re.compile(r'\((\d+d\d+(?: [+-] \d+)?(?: plus \d+d\d+)?)\)')
-	PLUS_DICE_RE = re.compile(r'plus \d+ \((\d+d\d+(?: [+-] \d+)?)\)')
+	HIT_RE = base.lazy_compile('\+(\d+) to hit')
+	DICE_RE = base.lazy_compile(r'\((\d+d\d+(?: [+-] \d+)?(?: plus \d+d\d+)?)\)')
+	PLUS_DICE_RE = base.lazy_compile(r'plus \d+ \((\d+d\d+(?: [+-] \d+)?)\)')
 
-	SPELL_RE = re.compile(r'/([a-z ]+)/')
+	SPELL_RE = base.lazy_compile(r'/([a-z ]+)/')
 
-	def __init__(self, filename):
-		super(FightClubConverter, self).__init__(filename)
+	def __init__(self, filename, **kwargs):
+		super(FightClubConverter, self).__init__(filename, **kwargs)
 		self.sources = []
 		self.name = None
-		self.xml = ''
+		# Elements are collected as fragments and joined once, since appending to a string copies it.
+		self.fragments = []
+
+	def write(self, fragment):
+		self.fragments.append(fragment)
+
+	def xml(self):
+		return "".join(self.fragments)
 
 	def add_tag(self, tag, value):
-		self.xml += '\t\t<%s>%s</%s>\n' % (tag, escape(value), tag)
+		self.write('\t\t<%s>%s</%s>\n' % (tag, escape(value), tag))
 
 	def handle_name(self, name):
 		self.name = name
 		self.add_tag('name', name)
 
 	def handle_source(self, source, page, section):
-		source_name = self.SOURCES[source]
+		# Only the books Fight Club knows of are named in the type.
+		source_name = self.SOURCES.get(source)
 		if source_name is not None:
 			self.sources.append(source_name)
 
@@ -142,13 +156,13 @@ class FightClubConverter(monster.MonsterParser):
 		attack_plus_dice = None
 
 		name = name.rstrip('.')
-		name = name.replace('–', '-')
+		name = name.replace(u'–', u'-')
 
-		self.xml += '\t\t<%s>\n' % escape(tag)
-		self.xml += '\t\t\t<name>%s</name>\n' % escape(name)
+		self.write('\t\t<%s>\n' % escape(tag))
+		self.write('\t\t\t<name>%s</name>\n' % escape(name))
 		for line in lines:
 			line = self.SPELL_RE.sub(r'\1', line)
-			self.xml += '\t\t\t<text>%s</text>\n' % escape(line)
+			self.write('\t\t\t<text>%s</text>\n' % escape(line))
 
 			if attack_hit is None:
 				match = self.HIT_RE.search(line)
@@ -171,8 +185,8 @@ class FightClubConverter(monster.MonsterParser):
 			if attack_dice is not None and attack_plus_dice is not None:
 				attack_dice += '+%s' % attack_plus_dice
 
-			self.xml += '\t\t\t<attack>%s|%s|%s</attack>\n' % (escape(attack_name), escape(attack_hit or ''), escape(attack_dice or ''))
-		self.xml += '\t\t</%s>\n' % escape(tag)
+			self.write('\t\t\t<attack>%s|%s|%s</attack>\n' % (escape(attack_name), escape(attack_hit or ''), escape(attack_dice or '')))
+		self.write('\t\t</%s>\n' % escape(tag))
 
 	def handle_traits(self, traits):
 		for name, lines in traits:
@@ -190,27 +204,142 @@ class FightClubConverter(monster.MonsterParser):
 		for name, lines in actions:
 			self.add_action('legendary', name, lines, with_attack=False)
 
-def main():
-	monsters = []
-	for filename in monster.local_files():
-		parser = FightClubConverter(filename)
+def convert_file(filename):
+	parser = None
+	try:
 		try:
-			try:
-				parser.parse()
-				monsters.append((parser.name, parser.xml))
-			except monster.ParseException, e:
-				print >>sys.stderr, "%s:%d:%s" % (e.filename, e.lineno, e.message)
-				sys.exit(1)
-		finally:
+			# Reading the file can fail too, such as on invalid UTF-8.
+			parser = FightClubConverter(filename)
+			parser.parse()
+			return ((parser.name, parser.xml().encode('utf8')), None)
+		except base.ParseException, e:
+			# ParseException doesn't survive pickling, so hand back the location and message instead.
+			return (None, (e.lineno, e.message))
+	finally:
+		if parser is not None:
 			parser.close()
 
-	print '<?xml version="1.0" encoding="UTF-8"?>'
-	print '<compendium version="5">'
-	for name, xml in sorted(monsters):
-		print '\t<monster>'
-		print xml,
-		print '\t</monster>'
-	print '</compendium>'
+class FightClubBackend(object):
+	"""Fills a FightClubConverter from the record of a monster parsed for another output as well."""
+
+	def convert(self, filename, record):
+		parser = FightClubConverter(filename, lines=[])
+		record.replay(parser)
+		return (parser.name, parser.xml().encode('utf8'))
+
+class MonsterSorter(object):
+	"""Sorts converted monsters by name, keeping at most run_size of them in memory.
+
+	Once there are more than that, each sorted run is written to a temporary file and the runs are
+	merged as they're read back. Monsters with the same name stay in the order they were added.
+	"""
+
+	def __init__(self, run_size):
+		self.run_size = run_size
+		self.count = 0
+		self.run = []
+		self.run_files = []
+
+	def add(self, name, xml):
+		self.run.append((name, self.count, xml))
+		self.count += 1
+		if len(self.run) >= self.run_size:
+			self.write_run()
+
+	def write_run(self):
+		self.run.sort()
+
+		run_file = tempfile.TemporaryFile()
+		for record in self.run:
+			cPickle.dump(record, run_file, cPickle.HIGHEST_PROTOCOL)
+		run_file.seek(0)
+
+		self.run_files.append(run_file)
+		self.run = []
+
+	def read_run(self, run_file):
+		while True:
+			try:
+				yield cPickle.load(run_file)
+			except EOFError:
+				return
+
+	def __iter__(self):
+		# The add order is unique, so the merge never has to compare the XML itself.
+		self.run.sort()
+		runs = [ self.read_run(run_file) for run_file in self.run_files ]
+		runs.append(iter(self.run))
+
+		for name, index, xml in heapq.merge(*runs):
+			yield (name, xml)
+
+	def close(self):
+		for run_file in self.run_files:
+			run_file.close()
+		self.run_files = []
+
+def write_compendium(output, monsters):
+	"""Write the compendium document, from (name, xml) pairs in the order to list them."""
+	output.write('<?xml version="1.0" encoding="UTF-8"?>\n')
+	output.write('<compendium version="5">\n')
+	for name, xml in monsters:
+		output.write('\t<monster>\n')
+		output.write(xml)
+		output.write('\t</monster>\n')
+	output.write('</compendium>\n')
+
+
+def main():
+	argparser = argparse.ArgumentParser(description="Convert monsters to a Fight Club compendium.")
+	argparser.add_argument("-j", "--jobs", type=int, default=1,
+						   help="number of worker processes to convert files with")
+	argparser.add_argument("--profile", action="store_true",
+						   help="time each parser handler and print a table of them to standard error, "
+						   "converting every file in this process")
+	argparser.add_argument("--run-size", type=int, default=10000,
+						   help="number of monsters to sort in memory before spilling them to a temporary file")
+	argparser.add_argument("files", nargs="*",
+						   help="files to convert, instead of the Monsters directory")
+	options = argparser.parse_args()
+
+	if options.profile:
+		base.Parser.profile = base.Profile()
+
+	pool = None
+	if options.jobs > 1 and not options.profile:
+		pool = multiprocessing.Pool(options.jobs)
+
+	monsters = MonsterSorter(options.run_size)
+	try:
+		filenames = base.local_files('Monsters', options.files)
+		if pool is not None:
+			# imap() keeps results in the same order as the serial run.
+			results = pool.imap(convert_file, filenames)
+		else:
+			results = itertools.imap(convert_file, filenames)
+
+		# Report every file that fails, but don't write a compendium missing some of them.
+		error_count = 0
+		for filename, (monster, error) in itertools.izip(filenames, results):
+			if error is not None:
+				(lineno, message) = error
+				print >>sys.stderr, "%s:%d:%s" % (filename, lineno, message)
+				error_count += 1
+			else:
+				monsters.add(*monster)
+
+		if error_count:
+			sys.exit(1)
+
+		write_compendium(sys.stdout, monsters)
+	finally:
+		monsters.close()
+		if pool is not None:
+			pool.close()
+			pool.join()
+
+	if options.profile:
+		base.Parser.profile.report(sys.stderr)
 
 
 if __name__ == "__main__":
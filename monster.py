@@ -1,17 +1,44 @@
 #!/usr/bin/env python
 # -*- coding: utf8 -*-
 
-import re
-
 import base
 
-SOURCE_RE = re.compile(r'^([a-z]+) (\d+)(?:; (.*))?$')
+SOURCE_RE = base.lazy_compile(r'^([a-z]+) (\d+)(?:; (.*))?$')
 
 ENVIRONMENTS = [ 'arctic', 'coastal', 'desert', 'forest', 'grassland', 'hill', 'mountain',
 			     'swamp', 'underdark', 'underwater', 'urban' ]
 
 class MonsterParser(base.Parser):
-	def parse(self):
+	BASIC_LABELS = base.LabelBlock([
+		("Armor Class", "handle_armor_class"),
+		("Hit Points", "handle_hit_points"),
+		("Speed", "handle_speed"),
+	], all=True)
+
+	ABILITY_LABELS = base.LabelBlock([
+		("STR", "handle_str"),
+		("DEX", "handle_dex"),
+		("CON", "handle_con"),
+		("INT", "handle_int"),
+		("WIS", "handle_wis"),
+		("CHA", "handle_cha"),
+	], all=True)
+
+	DETAIL_LABELS = base.LabelBlock([
+		("Saving Throws", "handle_saving_throws"),
+		("Skills", "handle_skills"),
+		("Damage Vulnerabilities", "handle_damage_vulnerabilities"),
+		("Damage Resistances", "handle_damage_resistances"),
+		("Damage Resistance", "handle_archmage_damage_resistance"),
+		("Damage Immunities", "handle_damage_immunities"),
+		("Condition Immunities", "handle_condition_immunities"),
+		("Senses", "handle_senses"),
+		("Languages", "handle_languages"),
+		("Challenge", "handle_challenge"),
+	])
+
+	def parse_header(self):
+		"""Parse the name, metadata and size/type/alignment lines at the start of the file."""
 		line = self.next_line(error_message="Expected name")
 		self.handle_name(line)
 
@@ -33,38 +60,14 @@ class MonsterParser(base.Parser):
 
 		self.handle_size_type_alignment(line)
 
+	def parse(self):
+		self.parse_header()
+
 		self.blank_line(error_message="Expected blank line after header")
 
-		lines = {
-			"Armor Class": self.handle_armor_class,
-			"Hit Points": self.handle_hit_points,
-			"Speed": self.handle_speed,
-		}
-		self.label_block(lines, all=True)
-
-		lines = {
-			"STR": self.handle_str,
-			"DEX": self.handle_dex,
-			"CON": self.handle_con,
-			"INT": self.handle_int,
-			"WIS": self.handle_wis,
-			"CHA": self.handle_cha,
-		}
-		self.label_block(lines, all=True)
-
-		lines = {
-			"Saving Throws": self.handle_saving_throws,
-			"Skills": self.handle_skills,
-			"Damage Vulnerabilities": self.handle_damage_vulnerabilities,
-			"Damage Resistances": self.handle_damage_resistances,
-			"Damage Resistance": self.handle_archmage_damage_resistance,
-			"Damage Immunities": self.handle_damage_immunities,
-			"Condition Immunities": self.handle_condition_immunities,
-			"Senses": self.handle_senses,
-			"Languages": self.handle_languages,
-			"Challenge": self.handle_challenge,
-		}
-		self.label_block(lines, all=False)
+		self.label_block(self.BASIC_LABELS)
+		self.label_block(self.ABILITY_LABELS)
+		self.label_block(self.DETAIL_LABELS)
 
 		# Parse the common set of traits, actions, reactions, and legendary actions
 		handler = self.handle_traits
@@ -125,7 +128,7 @@ class MonsterParser(base.Parser):
 				lair_actions = []
 				while True:
 					line = self.next_line()
-					if line is not None and line.startswith("• "):
+					if line is not None and line.startswith(u"• "):
 						lair_action = [ line ]
 						lair_action += self.parse_lines()
 						lair_actions.append(lair_action)
@@ -152,7 +155,7 @@ class MonsterParser(base.Parser):
 				lair_traits = []
 				while True:
 					line = self.next_line()
-					if line is not None and line.startswith("• "):
+					if line is not None and line.startswith(u"• "):
 						lair_trait = [ line ]
 						lair_trait += self.parse_lines()
 						lair_traits.append(lair_trait)
@@ -169,7 +172,7 @@ class MonsterParser(base.Parser):
 				regional_effects = []
 				while True:
 					line = self.next_line()
-					if line is not None and line.startswith("• "):
+					if line is not None and line.startswith(u"• "):
 						regional_effect = [ line ]
 						regional_effect += self.parse_lines()
 						regional_effects.append(regional_effect)
@@ -314,7 +317,7 @@ monster_type_expr = "|".join(MONSTER_TYPES)
 alignment_expr = "|".join(ALIGNMENTS)
 alignment_option_expr = "|".join(ALIGNMENT_OPTIONS.keys())
 
-SIZE_TYPE_TAG_ALIGNMENT_RE  = re.compile(
+SIZE_TYPE_TAG_ALIGNMENT_RE  = base.lazy_compile(
 	r'^(?:(' + size_expr + r') (' + monster_type_expr + r')'
 	r'|(' + size_expr + r') (?:swarm of (' + size_expr + r') (' + monster_type_expr + r')s))' +
 	r'(?: \(([^)]+)\))?, ' +
@@ -334,20 +337,20 @@ armor_expr = "|".join(armor for armor in ARMOR_TYPES if armor is not None)
 damage_expr = "|".join(DAMAGE_TYPES)
 condition_expr = "|".join(CONDITIONS)
 
-ARMOR_CLASS_RE = re.compile(
+ARMOR_CLASS_RE = base.lazy_compile(
 	r'^(\d+)(?: \((?:([+-]\d+) )?(' + armor_expr + r')(?: armor)?(?:, (shield))?\))?' +
 	r'(?: \((\d+) with ([^)]+)\))?' +
 	r'(?:, (\d+) while (' + condition_expr + r'))?$')
 #	r'| (in [^,]+ form), (\d+) \((' + armor_expr + r')(?: armor)?\) (in .+ form))?$')
-HIT_POINTS_RE = re.compile(r'^(\d+) \(([^)]*)\)$')
+HIT_POINTS_RE = base.lazy_compile(r'^(\d+) \(([^)]*)\)$')
 
-SPEED_RE = re.compile(
+SPEED_RE = base.lazy_compile(
 	r'^(\d+) ft\.(?:, burrow (\d+) ft\.)?(?:, climb (\d+) ft\.)?' +
 	r'(?:, fly (\d+) ft\.(?: \((hover)\))?)?(?:, swim (\d+) ft\.)?$')
 
-ABILITY_RE = re.compile(r'^(\d+) \(([+-]\d+)\)$')
+ABILITY_RE = base.lazy_compile(r'^(\d+) \(([+-]\d+)\)$')
 
-SAVING_THROW_SKILLS_RE = re.compile(r'^([A-Za-z ]+) ([+-]\d+)$')
+SAVING_THROW_SKILLS_RE = base.lazy_compile(r'^([A-Za-z ]+) ([+-]\d+)$')
 
 SHORT_ABILITIES = [ "Str", "Dex", "Con", "Int", "Wis", "Cha" ]
 LONG_ABILITIES = [ "Strength", "Dexterity", "Constitution", "Intelligence", "Wisdom", "Charisma" ]
@@ -361,12 +364,12 @@ SKILLS = [
 	[ "Deception", "Intimidation", "Performance", "Persuasion" ]
 ]
 
-DAMAGE_VULNERABILITIES_RE = re.compile(
+DAMAGE_VULNERABILITIES_RE = base.lazy_compile(
 	r'^(?:((?:(?:' + damage_expr + ')(?:, |$))+)' +
 	r'|(' + damage_expr + r') from magic weapons wielded by good creatures)$' # Rakshasa
 	)
 
-DAMAGE_RESISTANCES_RE = re.compile(
+DAMAGE_RESISTANCES_RE = base.lazy_compile(
 	r'^(?=.)' +
 	r'(?:' +
 		r'((?:(?:' + damage_expr + ')(?:, |(?=; )|$))+)' +
@@ -383,16 +386,16 @@ DAMAGE_RESISTANCES_RE = re.compile(
 	r'$'
 	)
 
-DAMAGE_RESISTANCE_OPTIONS_RE = re.compile(
+DAMAGE_RESISTANCE_OPTIONS_RE = base.lazy_compile(
 	r'^one of the following: ((?:(?:' + damage_expr + ')(?:, ))+)or (' + damage_expr + ')$')
 
-ARCHMAGE_DAMAGE_RESISTANCE_RE = re.compile(
+ARCHMAGE_DAMAGE_RESISTANCE_RE = base.lazy_compile(
 	r'^damage from spells; nonmagical ' +
 	r'((?:(?:' + damage_expr + ')(?:, ))+)and (' + damage_expr + ')' +
 	r' \(from ([^)]+)\)$')
 
 # This is basically the same as above, so keep the two roughly in sync except for the special-cases.
-DAMAGE_IMMUNITIES_RE = re.compile(
+DAMAGE_IMMUNITIES_RE = base.lazy_compile(
 	r'^(?=.)' +
 	r'(?:' +
 		r'((?:(?:' + damage_expr + ')(?:, |(?=; )|$))+)' +
@@ -408,9 +411,9 @@ DAMAGE_IMMUNITIES_RE = re.compile(
 	r'$'
 	)
 
-CONDITION_IMMUNITIES_RE = re.compile(r'^(?:(?:' + condition_expr + ')(?:, |$))+$')
+CONDITION_IMMUNITIES_RE = base.lazy_compile(r'^(?:(?:' + condition_expr + ')(?:, |$))+$')
 
-SENSES_RE = re.compile(
+SENSES_RE = base.lazy_compile(
 	r'^(?:blindsight (\d+) ft\.(?: \((blind beyond this radius)\))?(?:, |$))?'
 	r'(?:darkvision (\d+) ft\.(?:, |$))?'
 	r'(?:tremorsense (\d+) ft\.(?:, |$))?'
@@ -419,7 +422,7 @@ SENSES_RE = re.compile(
 
 language_expr = r'[A-Z][a-z-]+(?: [A-Z][a-z]+|\' cant)*'
 
-LANGUAGES_RE = re.compile(
+LANGUAGES_RE = base.lazy_compile(
 	r'^(?=.)(?:-|' +
 	r'(?:(?:' +
 		r'((?:' + language_expr + r'(?:, |(?= plus )|$))+)' +
@@ -444,10 +447,244 @@ LANGUAGES_RE = re.compile(
 	r')$'
 	)
 
-DICE_RE = re.compile(r'^(?:[1-9][0-9]*(?:d(?:2|4|6|8|10|12|20|100))?(?: *[+-] *(?=[^ ]))?)+$')
-DICE_ANYWHERE_RE = re.compile(r'(?:[1-9][0-9]*(?:d(?:2|4|6|8|10|12|20|100))?(?: *[+-] *(?=[^ ]))?)+')
+# The expressions above backtrack badly on long malformed lines, so the handlers use the scanners
+# below instead. They return exactly the groups the expressions would, and the expressions are kept
+# as the reference grammar for compare_fields.py.
+
+LANGUAGE_RE = base.lazy_compile(language_expr)
+NUMBER_RE = base.lazy_compile(r'[0-9]+')
+
+class FieldScanner(object):
+	"""Scans a field left to right, in time linear in its length.
+
+	Every step either consumes the text it expects or leaves the position unchanged, and nothing is
+	ever retried, so there's no backtracking.
+	"""
+
+	def __init__(self, line):
+		self.line = line
+		self.pos = 0
+
+	def at_end(self):
+		return self.pos == len(self.line)
+
+	def peek(self, text):
+		return self.line.startswith(text, self.pos)
+
+	def literal(self, text):
+		if self.line.startswith(text, self.pos):
+			self.pos += len(text)
+			return True
+		return False
+
+	def one_of(self, texts):
+		for text in texts:
+			if self.literal(text):
+				return text
+		return None
+
+	def token(self, regex):
+		match = regex.match(self.line, self.pos)
+		if match is None:
+			return None
+		self.pos = match.end()
+		return match.group(0)
+
+	def separator(self):
+		"""Consume ", " or match the end of the field, like (?:, |$)."""
+		return self.literal(", ") or self.at_end()
+
+
+def is_damage_list(text):
+	# ((?:D(?:, |(?=; )|$))+) ending at "; " or the end, so a trailing ", " is allowed.
+	if text.endswith(", "):
+		text = text[:-2]
+	return all(damage_type in DAMAGE_TYPES for damage_type in text.split(", "))
+
+def match_damage_line(line, qualifiers):
+	"""Return the groups of DAMAGE_RESISTANCES_RE or DAMAGE_IMMUNITIES_RE for line, or None.
+
+	qualifiers maps each " from ..." suffix the expression allows to the groups it sets.
+	"""
+	if not len(line):
+		return None
+
+	no_qualifier = (None,) * len(qualifiers.itervalues().next())
+
+	if "; " in line:
+		(damage_list, rest) = line.split("; ", 1)
+		if not is_damage_list(damage_list):
+			return None
+		if not len(rest):
+			return (damage_list, None, None, None, None, None) + no_qualifier
+	elif is_damage_list(line):
+		return (line, None, None, None, None, None) + no_qualifier
+	else:
+		(damage_list, rest) = (None, line)
+
+	# Anything other than a plain list has to say what the damage is from.
+	qualifier_index = rest.find(" from ")
+	if qualifier_index < 0:
+		return None
+
+	damages = rest[:qualifier_index]
+	qualifier = qualifiers.get(rest[qualifier_index:])
+	if qualifier is None:
+		return None
+
+	parts = damages.split(", ")
+	if len(parts) == 1:
+		if damages in DAMAGE_TYPES:
+			return (damage_list, damages, None, None, None, None) + qualifier
+
+		pair = damages.split(" and ")
+		if len(pair) == 2 and pair[0] in DAMAGE_TYPES and pair[1] in DAMAGE_TYPES:
+			return (damage_list, None, pair[0], pair[1], None, None) + qualifier
+	else:
+		last = parts.pop()
+		if (last.startswith("and ") and last[4:] in DAMAGE_TYPES and
+				all(damage_type in DAMAGE_TYPES for damage_type in parts)):
+			return (damage_list, None, None, None, ", ".join(parts) + ", ", last[4:]) + qualifier
+
+	return None
+
+DAMAGE_RESISTANCE_QUALIFIERS = {
+	" from nonmagical attacks": (None, None, None),
+	" from nonmagical attacks not made with adamantine weapons": ("adamantine", None, None),
+	" from nonmagical attacks not made with silvered weapons": ("silvered", None, None),
+	" from magic weapons": (None, "magic", None), # Demilich
+	" from nonmagical weapons that aren't silvered": (None, None, "silvered"), # Old-style nonmagical non-silvered
+}
+
+DAMAGE_IMMUNITY_QUALIFIERS = {
+	" from nonmagical attacks": (None,),
+	" from nonmagical attacks not made with adamantine weapons": ("adamantine",),
+	" from nonmagical attacks not made with silvered weapons": ("silvered",),
+	" from nonmagical weapons": (None,), # Old-style nonmagical
+}
+
+def match_damage_resistances(line):
+	return match_damage_line(line, DAMAGE_RESISTANCE_QUALIFIERS)
+
+def match_damage_immunities(line):
+	return match_damage_line(line, DAMAGE_IMMUNITY_QUALIFIERS)
+
+def match_languages(line):
+	"""Return the groups of LANGUAGES_RE for line, or None."""
+	groups = [ None ] * 20
+	if line == "-":
+		return tuple(groups)
+	elif not len(line):
+		return None
+
+	scanner = FieldScanner(line)
+
+	# Languages spoken.
+	start = scanner.pos
+	while True:
+		item_start = scanner.pos
+		if scanner.token(LANGUAGE_RE) is None:
+			break
+		if not (scanner.literal(", ") or scanner.peek(" plus ") or scanner.at_end()):
+			scanner.pos = item_start
+			break
+	if scanner.pos > start:
+		groups[0] = line[start:scanner.pos]
+	elif scanner.literal("any languages it knew in life") or scanner.literal("the languages it knew in life"):
+		groups[1] = line[:3]
+	elif scanner.literal("one language known by its creator"):
+		groups[2] = "creator"
+	elif scanner.literal("any one language"):
+		groups[3] = "one"
+		if scanner.literal(" (usually Common)"):
+			groups[4] = "usually Common"
+	elif scanner.literal("any "):
+		groups[5] = scanner.one_of([ "two", "four", "six" ])
+		if groups[5] is None or not scanner.literal(" languages"):
+			return None
+	elif scanner.literal("all"):
+		groups[6] = "all"
+
+	if scanner.pos > start:
+		if groups[0] is None and not scanner.separator():
+			return None
+
+		if scanner.literal(" plus one other language"):
+			groups[7] = "plus one other"
+		elif scanner.literal(" plus any two languages"):
+			groups[8] = "plus any two"
+		elif scanner.literal(" plus up to five other languages"):
+			groups[9] = "plus up to five"
+
+	# Languages understood.
+	if scanner.literal("understands "):
+		if scanner.literal("all languages it knew in life but can't speak"):
+			groups[15] = "all"
+		elif scanner.literal("the languages it knew in life but can't speak"):
+			groups[15] = "the"
+		elif scanner.literal("the languages of its creator but can't speak"):
+			groups[16] = "creator"
+		elif scanner.literal("commands given in any language but can't speak"):
+			groups[17] = "commands"
+		else:
+			list_start = scanner.pos
+			language = scanner.token(LANGUAGE_RE)
+			if language is None:
+				return None
+
+			if scanner.literal(" but can't speak") or scanner.literal(" but doesn't speak"):
+				groups[10] = language
+				scanner.literal(" it")
+			elif scanner.literal(" and "):
+				groups[11] = language
+				groups[12] = scanner.token(LANGUAGE_RE)
+				if groups[12] is None or not scanner.literal(" but can't speak"):
+					return None
+				scanner.literal(" them")
+			elif scanner.literal(", "):
+				while True:
+					item_start = scanner.pos
+					if scanner.token(LANGUAGE_RE) is None:
+						break
+					if not scanner.literal(", "):
+						scanner.pos = item_start
+						break
+				groups[13] = line[list_start:scanner.pos]
+
+				if not scanner.literal("and "):
+					return None
+				groups[14] = scanner.token(LANGUAGE_RE)
+				if groups[14] is None or not scanner.literal(" but can't speak"):
+					return None
+				scanner.literal(" them")
+			else:
+				return None
+
+		if not scanner.separator():
+			return None
 
-CHALLENGE_RE = re.compile(r'^([0-9/]+) \(([0-9,]+)(?: XP)?\)$')
+	# Telepathy.
+	if scanner.literal("telepathy "):
+		groups[18] = scanner.token(NUMBER_RE)
+		if groups[18] is None or not scanner.literal(" ft."):
+			return None
+
+		paren_start = scanner.pos
+		if scanner.literal(" (works only with creatures that understand "):
+			groups[19] = scanner.token(LANGUAGE_RE)
+			if groups[19] is None or not scanner.literal(")") or not scanner.at_end():
+				groups[19] = None
+				scanner.pos = paren_start
+
+	if not scanner.at_end():
+		return None
+
+	return tuple(groups)
+
+DICE_RE = base.lazy_compile(r'^(?:[1-9][0-9]*(?:d(?:2|4|6|8|10|12|20|100))?(?: *[+-] *(?=[^ ]))?)+$')
+DICE_ANYWHERE_RE = base.lazy_compile(r'(?:[1-9][0-9]*(?:d(?:2|4|6|8|10|12|20|100))?(?: *[+-] *(?=[^ ]))?)+')
+
+CHALLENGE_RE = base.lazy_compile(r'^([0-9/]+) \(([0-9,]+)(?: XP)?\)$')
 
 XP = {
 	"0": "10",
@@ -486,11 +723,85 @@ XP = {
 	"30": "155,000",
 }
 
+def has_bad_hyphenation(line):
+	# Hyphens followed by a space are fine within dice expressions, such as 1d6 - 1.
+	for part in DICE_ANYWHERE_RE.split(line):
+		if "- " in part:
+			return True
+	return False
+
+def challenge_rating(cr):
+	if cr == '1/8':
+		return 1.0/8
+	elif cr == '1/4':
+		return 1.0/4
+	elif cr == '1/2':
+		return 1.0/2
+	else:
+		return float(cr)
+
+class MonsterInfo(base.Struct):
+	__slots__ = ("isNPC", "rawSize", "rawSwarmSize", "rawType", "requiresRace", "rawAlignment",
+				 "rawHitPoints", "rawHitDice", "rawSpeed", "rawBurrowSpeed", "rawClimbSpeed", "rawFlySpeed",
+				 "canHover", "rawSwimSpeed", "rawStrengthScore", "rawDexterityScore", "rawConstitutionScore",
+				 "rawIntelligenceScore", "rawWisdomScore", "rawCharismaScore", "isResistantToSpellDamage",
+				 "rawBlindsight", "isBlind", "rawDarkvision", "rawTremorsense", "rawTruesight",
+				 "rawLanguagesSpokenOption", "canSpeakAllLanguages", "rawLanguagesUnderstoodOption",
+				 "canUnderstandAllLanguages", "rawTelepathy", "telepathyIsLimited", "challenge")
+
+class Armor(base.Struct):
+	__slots__ = ("rawArmorClass", "rawType", "includesShield", "rawMagicModifier", "spellName", "rawCondition")
+
+class Damage(base.Struct):
+	__slots__ = ("rawDamageType", "rawAttackType", "spellName")
+
+class Action(base.Struct):
+	__slots__ = ("name", "text")
+
+class LairInfo(base.Struct):
+	__slots__ = ("text", "lairActionsText", "lairActionsLimit", "lairTraitsText", "lairTraitsDuration",
+				 "regionalEffectsText", "regionalEffectsDuration")
+
+class Lair(base.Struct):
+	__slots__ = ("info", "lairActions", "lairTraits", "regionalEffects")
+
+class Monster(base.Struct):
+	"""An exported monster.
+
+	Saving throws are kept as (ability, modifier) pairs, skills as (ability, skill, modifier) triples, and
+	condition immunities as the conditions alone; object() expands them to what the export expects.
+	"""
+
+	__slots__ = ("name", "names", "sources", "environments", "tags", "alignmentOptions", "armor",
+				 "savingThrows", "skills", "damageVulnerabilities", "damageResistances", "damageResistanceOptions",
+				 "damageImmunities", "conditionImmunities", "languagesSpoken", "languagesUnderstood", "info",
+				 "traits", "actions", "reactions", "legendaryActions", "lair")
+
+	def object(self):
+		object = super(Monster, self).object()
+
+		object["savingThrows"] = dict((str(ability), modifier) for ability, modifier in self.savingThrows)
+
+		skills = {}
+		for ability, skill, modifier in self.skills:
+			skills.setdefault(str(ability), {})[str(skill)] = modifier
+		object["skills"] = skills
+
+		object["conditionImmunities"] = [ { "rawCondition": condition } for condition in self.conditionImmunities ]
+
+		return object
+
 class MonsterExporter(MonsterParser):
+	lint_rules = MonsterParser.lint_rules + [
+		base.LintRule("Probable bad hyphenation", strings=[ "- " ], verify=has_bad_hyphenation),
+	]
 
-	def __init__(self, filename, bookTags):
-		super(MonsterExporter, self).__init__(filename)
+	def __init__(self, filename, bookTags, excludedBookTags=(), **kwargs):
+		super(MonsterExporter, self).__init__(filename, **kwargs)
 		self.bookTags = bookTags
+		# Tags of books left out of the export; their sources are dropped rather than unknown.
+		self.excludedBookTags = excludedBookTags
+		self.excluded_sources = 0
 
 		self.name = None
 		self.names = []
@@ -513,72 +824,78 @@ class MonsterExporter(MonsterParser):
 		self.actions = []
 		self.reactions = []
 		self.legendary_actions = []
-		self.lair = None
+		self.lair_info = None
 
 		self.wisdom = None
 		self.perception = None
 
-	def check_line(self, line):
-		super(MonsterExporter, self).check_line(line)
-
-		for part in DICE_ANYWHERE_RE.split(line):
-			if "- " in part:
-				raise self.error("Probable bad hyphenation: %s" % line)
-
-	def object(self):
+	def validate(self):
 		if len(self.sources) == 0:
 			raise self.error("No sources for this monster")
 
-		object = {
-			"name": unicode(self.name, 'utf8'),
-			"names": self.names,
-			"sources": self.sources,
-			"environments": self.environments,
-			"tags": self.tags,
-			"alignmentOptions": self.alignment_options,
-			"armor": self.armor,
-			"savingThrows": self.saving_throws,
-			"skills": self.skills,
-			"damageVulnerabilities": self.damage_vulnerabilities,
-			"damageResistances": self.damage_resistances,
-			"damageResistanceOptions": self.damage_resistance_options,
-			"damageImmunities": self.damage_immunities,
-			"conditionImmunities": self.condition_immunities,
-			"languagesSpoken": self.languages_spoken,
-			"languagesUnderstood": self.languages_understood,
-			"info": self.info,
-			"traits": self.traits,
-			"actions": self.actions,
-			"reactions": self.reactions,
-			"legendaryActions": self.legendary_actions,
-		}
-		if self.lair is not None:
-			object['lair'] = self.lair
-
-		return object
+	def parse_header(self):
+		super(MonsterExporter, self).parse_header()
+		# Only in books left out of the export, so there's no need to parse the rest.
+		if len(self.sources) == 0 and self.excluded_sources > 0:
+			raise base.SkipFile()
+
+	def export(self):
+		"""Return the parsed monster as a Monster, for keeping until it's written out."""
+		self.validate()
+
+		lair = None
+		if self.lair_info is not None:
+			lair = Lair(
+				info=LairInfo(**self.lair_info),
+				lairActions=tuple(self.lair_actions),
+				lairTraits=tuple(self.lair_traits),
+				regionalEffects=tuple(self.regional_effects))
+
+		skills = tuple((int(ability), int(skill), modifier)
+					   for ability, skills in sorted(self.skills.iteritems())
+					   for skill, modifier in sorted(skills.iteritems()))
+
+		return Monster(
+			name=self.name,
+			names=tuple(self.names),
+			sources=tuple(self.sources),
+			environments=tuple(self.environments),
+			tags=tuple(self.tags),
+			alignmentOptions=tuple(self.alignment_options),
+			armor=tuple(self.armor),
+			savingThrows=tuple(sorted((int(ability), modifier) for ability, modifier in self.saving_throws.iteritems())),
+			skills=skills,
+			damageVulnerabilities=tuple(self.damage_vulnerabilities),
+			damageResistances=tuple(self.damage_resistances),
+			damageResistanceOptions=tuple(self.damage_resistance_options),
+			damageImmunities=tuple(self.damage_immunities),
+			conditionImmunities=tuple(self.condition_immunities),
+			languagesSpoken=tuple(self.languages_spoken),
+			languagesUnderstood=tuple(self.languages_understood),
+			info=MonsterInfo(**self.info),
+			traits=tuple(self.traits),
+			actions=tuple(self.actions),
+			reactions=tuple(self.reactions),
+			legendaryActions=tuple(self.legendary_actions),
+			lair=lair)
 
 	def handle_name(self, name):
 		self.name = name
-		self.names.append(unicode(name, 'utf8'))
+		self.names.append(name)
 
 	def handle_old_name(self, name):
-		self.names.append(unicode(name, 'utf8'))
+		self.names.append(name)
 
 	def handle_source(self, source, page, section):
 		try:
 			index = self.bookTags.index(source)
 		except ValueError:
+			if source in self.excludedBookTags:
+				self.excluded_sources += 1
+				return
 			raise self.error("Unknown book tag: %s" % source)
 
-		source = {
-			"book": index,
-			"page": int(page),
-		}
-
-		if section is not None:
-			source["section"] = section
-
-		self.sources.append(source)
+		self.sources.append(base.Source(index, int(page), section))
 
 	def handle_npc(self):
 		self.info['isNPC'] = True
@@ -618,12 +935,12 @@ class MonsterExporter(MonsterParser):
 			self.info['rawAlignment'] = ALIGNMENTS.index(alignment)
 		elif alignment_option is not None:
 			for alignment in ALIGNMENT_OPTIONS[alignment_option]:
-				self.alignment_options.append([ ALIGNMENTS.index(alignment) ])
+				self.alignment_options.append(( ALIGNMENTS.index(alignment), ))
 		elif alignment1 is not None:
-			self.alignment_options.append([
-				ALIGNMENTS.index(alignment1), float(alignment1_weight) / 100.0 ])
-			self.alignment_options.append([
-				ALIGNMENTS.index(alignment2), float(alignment2_weight) / 100.0 ])
+			self.alignment_options.append((
+				ALIGNMENTS.index(alignment1), float(alignment1_weight) / 100.0 ))
+			self.alignment_options.append((
+				ALIGNMENTS.index(alignment2), float(alignment2_weight) / 100.0 ))
 
 	def handle_armor_class(self, line):
 		match = ARMOR_CLASS_RE.match(line)
@@ -635,36 +952,33 @@ class MonsterExporter(MonsterParser):
 		 armor_condition_class, armor_condition) = match.groups()
 		#armor_original_form, armor_form_class, armor_form_type, armor_form) = match.groups()
 
-		armor = {
-			'rawArmorClass': int(armor_class),
-			'rawType': ARMOR_TYPES.index(armor_type),
-			'includesShield': (shield is not None),
-		}
+		armor = Armor(
+			rawArmorClass=int(armor_class),
+			rawType=ARMOR_TYPES.index(armor_type),
+			includesShield=(shield is not None))
 		if magic_armor_modifier is not None:
-			armor['rawMagicModifier'] = int(magic_armor_modifier)
+			armor.rawMagicModifier = int(magic_armor_modifier)
 		#if armor_original_form is not None:
-		#	armor['form'] = armor_original_form
+		#	armor.form = armor_original_form
 
 		self.armor.append(armor)
 
 		# FIXME This is a hack right now to ensure they're displayed.
 		# Really we want to handle spells and magic items in their own right.
 		if armor_spell_class is not None:
-			armor = {
-				'rawArmorClass': int(armor_spell_class),
-				'rawType': 0,
-				'spellName': armor_spell,
-			}
+			armor = Armor(
+				rawArmorClass=int(armor_spell_class),
+				rawType=0,
+				spellName=armor_spell)
 
 			self.armor.append(armor)
 
 		# Condition-specific armor.
 		if armor_condition_class is not None:
-			armor = {
-				'rawArmorClass': int(armor_condition_class),
-				'rawType': 0,
-				'rawCondition': CONDITIONS.index(armor_condition),
-			}
+			armor = Armor(
+				rawArmorClass=int(armor_condition_class),
+				rawType=0,
+				rawCondition=CONDITIONS.index(armor_condition))
 
 			self.armor.append(armor)
 
@@ -796,20 +1110,14 @@ class MonsterExporter(MonsterParser):
 			damage_types = [ DAMAGE_TYPES.index(x) for x in damage_list.split(", ") ]
 
 			for damage_type in damage_types:
-				self.damage_vulnerabilities.append({
-					'rawDamageType': damage_type,
-					'rawAttackType': 0,
-				})
+				self.damage_vulnerabilities.append(Damage(damage_type, 0))
 
 		elif good_damage is not None:
-			self.damage_vulnerabilities.append({
-				'rawDamageType': DAMAGE_TYPES.index(good_damage),
-				'rawAttackType': 5,
-			})
+			self.damage_vulnerabilities.append(Damage(DAMAGE_TYPES.index(good_damage), 5))
 
 	def handle_damage_resistances(self, line):
-		match = DAMAGE_RESISTANCES_RE.match(line)
-		if match is None:
+		groups = match_damage_resistances(line)
+		if groups is None:
 			match = DAMAGE_RESISTANCE_OPTIONS_RE.match(line)
 			if match is not None:
 				return self.handle_damage_resistance_options(match)
@@ -818,16 +1126,13 @@ class MonsterExporter(MonsterParser):
 
 		(damage_list, nonmagical_damage0, nonmagical_damage1, nonmagical_damage2,
 		 nonmagical_damage_list, nonmagical_damage3,
-		 special_weapon_type, magic_not_nonmagic, oldstyle_nonmagical_special) = match.groups()
+		 special_weapon_type, magic_not_nonmagic, oldstyle_nonmagical_special) = groups
 
 		if damage_list is not None:
 			damage_types = [ DAMAGE_TYPES.index(x) for x in damage_list.split(", ") ]
 
 			for damage_type in damage_types:
-				self.damage_resistances.append({
-					'rawDamageType': damage_type,
-					'rawAttackType': 0,
-				})
+				self.damage_resistances.append(Damage(damage_type, 0))
 
 		nonmagical_damage_types = None
 		if nonmagical_damage_list is not None:
@@ -851,10 +1156,7 @@ class MonsterExporter(MonsterParser):
 				attack_type = 1
 
 			for damage_type in damage_types:
-				self.damage_resistances.append({
-					'rawDamageType': damage_type,
-					'rawAttackType': attack_type,
-				})
+				self.damage_resistances.append(Damage(damage_type, attack_type))
 
 	def handle_damage_resistance_options(self, match):
 		(damage_list, last_damage) = match.groups()
@@ -862,9 +1164,7 @@ class MonsterExporter(MonsterParser):
 		damage_types.append(DAMAGE_TYPES.index(last_damage))
 
 		for damage_type in damage_types:
-			self.damage_resistance_options.append({
-				'rawDamageType': damage_type,
-			})
+			self.damage_resistance_options.append(Damage(damage_type))
 
 	def handle_archmage_damage_resistance(self, line):
 		match = ARCHMAGE_DAMAGE_RESISTANCE_RE.match(line)
@@ -876,30 +1176,23 @@ class MonsterExporter(MonsterParser):
 		damage_types.append(DAMAGE_TYPES.index(last_damage))
 
 		for damage_type in damage_types:
-			self.damage_resistances.append({
-				'rawDamageType': damage_type,
-				'rawAttackType': 1,
-				'spellName': spell_name,
-			})
+			self.damage_resistances.append(Damage(damage_type, 1, spell_name))
 
 		self.info['isResistantToSpellDamage'] = True
 
 	def handle_damage_immunities(self, line):
-		match = DAMAGE_IMMUNITIES_RE.match(line)
-		if match is None:
+		groups = match_damage_immunities(line)
+		if groups is None:
 			raise self.error("Damage Immunities line didn't match expected format: %s" % line)
 
 		(damage_list, nonmagical_damage0, nonmagical_damage1, nonmagical_damage2,
-		 nonmagical_damage_list, nonmagical_damage3, special_weapon_type) = match.groups()
+		 nonmagical_damage_list, nonmagical_damage3, special_weapon_type) = groups
 
 		if damage_list is not None:
 			damage_types = [ DAMAGE_TYPES.index(x) for x in damage_list.split(", ") ]
 
 			for damage_type in damage_types:
-				self.damage_immunities.append({
-					'rawDamageType': damage_type,
-					'rawAttackType': 0,
-				})
+				self.damage_immunities.append(Damage(damage_type, 0))
 
 		nonmagical_damage_types = None
 		if nonmagical_damage_list is not None:
@@ -921,10 +1214,7 @@ class MonsterExporter(MonsterParser):
 				attack_type = 1
 
 			for damage_type in damage_types:
-				self.damage_immunities.append({
-					'rawDamageType': damage_type,
-					'rawAttackType': attack_type,
-				})
+				self.damage_immunities.append(Damage(damage_type, attack_type))
 
 	def handle_condition_immunities(self, line):
 		match = CONDITION_IMMUNITIES_RE.match(line)
@@ -932,10 +1222,7 @@ class MonsterExporter(MonsterParser):
 			raise self.error("Condition Immunities line didn't match expected format: %s" % line)
 
 		conditions = [ CONDITIONS.index(x) for x in line.split(", ") ]
-		for condition in conditions:
-			self.condition_immunities.append({
-				'rawCondition': condition
-			})
+		self.condition_immunities.extend(conditions)
 
 	def handle_senses(self, line):
 		match = SENSES_RE.match(line)
@@ -964,18 +1251,18 @@ class MonsterExporter(MonsterParser):
 			expectedPassive = 10 + (int(score) - 10) / 2
 
 		if int(passive) != expectedPassive:
-			raise self.error("Passive Perception didn't match expected value (%d): %d" % (expectedPassive, passive))
+			raise self.error("Passive Perception didn't match expected value (%d): %d" % (expectedPassive, int(passive)))
 
 	def handle_languages(self, line):
-		match = LANGUAGES_RE.match(line)
-		if match is None:
+		groups = match_languages(line)
+		if groups is None:
 			raise self.error("Languages didn't match expected format: %s" % line)
 
 		(language_list, speaks_knew, speaks_creator, speaks_one, speaks_common, speaks_option,
 		 speaks_all, plus_one, plus_two, plus_five,
 		 understands0, understands1, understands2, understands_list, understands3,
 		 understands_knew, understands_creator, understands_commands,
-		 telepathy, limited_telepathy) = match.groups()
+		 telepathy, limited_telepathy) = groups
 		if language_list is not None:
 			languages = language_list.split(", ")
 			if languages[-1] == "":
@@ -1039,25 +1326,13 @@ class MonsterExporter(MonsterParser):
 			if cr != "0" or xp != "0":
 				raise self.error("XP didn't match expected for challenge: %s" % xp)
 
-		if cr == '1/8':
-			cr = 1.0/8
-		elif cr == '1/4':
-			cr = 1.0/4
-		elif cr == '1/2':
-			cr = 1.0/2
-		else:
-			cr = float(cr)
-
-		self.info['challenge'] = cr
+		self.info['challenge'] = challenge_rating(cr)
 
 	def add_action(self, list, name, lines):
 		name = name.rstrip('.')
 		text = "\n".join(lines)
 
-		list.append({
-			"name": unicode(name, 'utf8'),
-			"text": unicode(text, 'utf8'),
-		})
+		list.append(Action(name, text))
 
 	def handle_traits(self, traits):
 		for name, lines in traits:
@@ -1069,7 +1344,7 @@ class MonsterExporter(MonsterParser):
 
 	def handle_yuan_ti_actions(self, section, actions):
 		for name, lines in actions:
-			self.add_action(self.actions, section + '—' + name, lines)
+			self.add_action(self.actions, section + u'—' + name, lines)
 
 	def handle_reactions(self, reactions):
 		for name, lines in reactions:
@@ -1083,49 +1358,121 @@ class MonsterExporter(MonsterParser):
 		text = "\n".join(lines)
 
 		self.lair_info = {
-			"text": unicode(text, 'utf8'),
+			"text": text,
 		}
 		self.lair_actions = []
 		self.lair_traits = []
 		self.regional_effects = []
 
-		self.lair = {
-			"info": self.lair_info,
-			"lairActions": self.lair_actions,
-			"lairTraits": self.lair_traits,
-			"regionalEffects": self.regional_effects,
-		}
-
 	def handle_lair_actions(self, intro_lines, lair_actions, limiting_lines):
 		intro_text = "\n".join(intro_lines)
-		self.lair_info["lairActionsText"] = unicode(intro_text, 'utf8')
+		self.lair_info["lairActionsText"] = intro_text
 
 		for lines in lair_actions:
 			text = "\n".join(lines)
-			self.lair_actions.append(unicode(text, 'utf8'))
+			self.lair_actions.append(text)
 
 		if limiting_lines is not None:
 			limiting_text = "\n".join(limiting_lines)
-			self.lair_info["lairActionsLimit"] = unicode(limiting_text, 'utf8')
+			self.lair_info["lairActionsLimit"] = limiting_text
 
 	def handle_lair_traits(self, intro_lines, lair_traits, duration_lines):
 		intro_text = "\n".join(intro_lines)
-		self.lair_info["lairTraitsText"] = unicode(intro_text, 'utf8')
+		self.lair_info["lairTraitsText"] = intro_text
 
 		for lines in lair_traits:
 			text = "\n".join(lines)
-			self.lair_traits.append(unicode(text, 'utf8'))
+			self.lair_traits.append(text)
 
 		duration_text = "\n".join(duration_lines)
-		self.lair_info["lairTraitsDuration"] = unicode(duration_text, 'utf8')
+		self.lair_info["lairTraitsDuration"] = duration_text
 
 	def handle_regional_effects(self, intro_lines, regional_effects, duration_lines):
 		intro_text = "\n".join(intro_lines)
-		self.lair_info["regionalEffectsText"] = unicode(intro_text, 'utf8')
+		self.lair_info["regionalEffectsText"] = intro_text
 
 		for lines in regional_effects:
 			text = "\n".join(lines)
-			self.regional_effects.append(unicode(text, 'utf8'))
+			self.regional_effects.append(text)
 
 		duration_text = "\n".join(duration_lines)
-		self.lair_info["regionalEffectsDuration"] = unicode(duration_text, 'utf8')
+		self.lair_info["regionalEffectsDuration"] = duration_text
+
+
+class MonsterRecorder(base.Recorder, MonsterParser):
+	"""Parses a monster once into a base.Record, to fill MonsterExporter, FightClubConverter and the like."""
+
+	# The export's rules are the strictest, so lint with them and the record suits every output.
+	lint_rules = MonsterExporter.lint_rules
+
+
+class MonsterEntry(base.Struct):
+	__slots__ = ("name", "names", "sources", "environments", "size", "monsterType", "challenge")
+
+class MonsterScanner(MonsterParser):
+	"""Reads just enough of a monster to catalog it: the header, and the challenge from the stat block.
+
+	It stops at the Challenge line, without linting or parsing anything else, so it's much faster than an
+	export but doesn't check the rest of the file.
+	"""
+
+	def __init__(self, filename, **kwargs):
+		super(MonsterScanner, self).__init__(filename, **kwargs)
+
+		self.name = None
+		self.names = []
+		self.sources = []
+		self.environments = []
+		self.size = None
+		self.monster_type = None
+		self.challenge = None
+
+	def entry(self):
+		return MonsterEntry(self.name, tuple(self.names), tuple(self.sources), tuple(self.environments),
+							self.size, self.monster_type, self.challenge)
+
+	def check_line(self, line):
+		pass
+
+	def parse(self):
+		self.parse_header()
+
+		while True:
+			line = self.next_line(error_message="Expected Challenge")
+			if line.startswith("Challenge "):
+				self.handle_challenge(line[len("Challenge "):])
+				return
+
+	def handle_name(self, name):
+		self.name = name
+		self.names.append(name)
+
+	def handle_old_name(self, name):
+		self.names.append(name)
+
+	def handle_source(self, source, page, section):
+		self.sources.append((source, page))
+
+	def handle_environment(self, environment):
+		self.environments.append(environment)
+
+	def handle_size_type_alignment(self, line):
+		match = SIZE_TYPE_TAG_ALIGNMENT_RE.match(line)
+		if match is None:
+			raise self.error("Size/Type/Alignment didn't match expected format: %s" % line)
+
+		(size, type, swarm_size, swarm_monster_size, swarm_type) = match.groups()[:5]
+		if swarm_size is not None:
+			size = swarm_monster_size
+			type = swarm_type
+
+		self.size = size.lower()
+		self.monster_type = type
+
+	def handle_challenge(self, line):
+		match = CHALLENGE_RE.match(line)
+		if match is None:
+			raise self.error("Challenge didn't match expected format: %s" % line)
+
+		(cr, xp) = match.groups()
+		self.challenge = challenge_rating(cr)
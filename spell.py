@@ -1,16 +1,22 @@
 #!/usr/bin/env python
 # -*- coding: utf8 -*-
 
-import re
-
 import base
 
-SOURCE_RE = re.compile(r'^([a-z]+) (\d+)(?:; (.*))?$')
+SOURCE_RE = base.lazy_compile(r'^([a-z]+) (\d+)(?:; (.*))?$')
 CLASSES = [ "barbarian", "bard", "cleric", "druid", "fighter", "monk", "paladin", "ranger",
 			"rogue", "sorcerer", "warlock", "wizard" ]
 
 class SpellParser(base.Parser):
-	def parse(self):
+	DETAIL_LABELS = base.LabelBlock([
+		("Casting Time:", "handle_casting_time"),
+		("Range:", "handle_range"),
+		("Components:", "handle_components"),
+		("Duration:", "handle_duration"),
+	], all=True)
+
+	def parse_header(self):
+		"""Parse the name, metadata and level/school lines at the start of the file."""
 		line = self.next_line(error_message="Expected name")
 		self.handle_name(line)
 
@@ -30,15 +36,12 @@ class SpellParser(base.Parser):
 
 		self.handle_level_school(line)
 
+	def parse(self):
+		self.parse_header()
+
 		self.blank_line(error_message="Expected blank line after header")
 
-		lines = {
-			"Casting Time:": self.handle_casting_time,
-			"Range:": self.handle_range,
-			"Components:": self.handle_components,
-			"Duration:": self.handle_duration,
-		}
-		self.label_block(lines, all=True)
+		self.label_block(self.DETAIL_LABELS)
 
 		lines = self.parse_all_lines()
 		self.handle_description(lines)
@@ -80,36 +83,48 @@ SCHOOLS = [ "abjuration", "conjuration", "divination", "enchantment", "evocation
 schools_expr = "|".join(SCHOOLS)
 schools_title_expr = "|".join(school.title() for school in SCHOOLS)
 
-LEVEL_SCHOOL_RE = re.compile(
+LEVEL_SCHOOL_RE = base.lazy_compile(
 	r'^(?:(\d+)(?:st|nd|rd|th)-level (' + schools_expr + r')(?: \((ritual)\))?' +
 	r'|(' + schools_title_expr + r') cantrip)$'
 	)
 
-CASTING_TIME_RE = re.compile(
+CASTING_TIME_RE = base.lazy_compile(
 	r'^(?:1 (?:(action)(?: or (\d+) (minutes?|hours?))?|(bonus action)|(reaction), which you take (.*))' +
 	r'|(\d+) (minutes?|hours?))$'
 	)
 
-RANGE_RE = re.compile(
+RANGE_RE = base.lazy_compile(
 	r'^(?:(\d+) (feet|miles?)' +
 	r'|(Self)(?: \((\d+)-(foot|mile)( radius| line| cone| cube|-radius sphere|-radius hemisphere)\))?' +
 	r'|(Special)|(Touch)|(Sight)|(Unlimited))$'
 	)
 
-COMPONENTS_RE = re.compile(
+COMPONENTS_RE = base.lazy_compile(
 	r'^(?=.)(?:(V)(?:, |$))?(?:(S)(?:, |$))?(?:M \(([^\)]*)\))?$'
 	)
 
-DURATION_RE = re.compile(
+DURATION_RE = base.lazy_compile(
 	r'^(?:(?:(Concentration,? up to )|(Up to ))?(\d+|one) (rounds?|minutes?|hours?|days?)\.?' +
 	r'|(Instantaneous)|(Special)|Until (dispelled)( or triggered)?)$'
 	)
 
+class SpellInfo(base.Struct):
+	__slots__ = ("rawLevel", "rawSchool", "canCastAsRitual", "canCastAsAction", "canCastAsBonusAction",
+				 "canCastAsReaction", "reactionResponse", "rawCastingTime", "rawRange", "rawRangeDistance",
+				 "rawRangeShape", "hasVerbalComponent", "hasSomaticComponent", "hasMaterialComponent",
+				 "materialComponent", "rawDuration", "requiresConcentration", "rawDurationTime", "text")
+
+class Spell(base.Struct):
+	__slots__ = ("name", "names", "sources", "classes", "info")
+
 class SpellExporter(SpellParser):
 
-	def __init__(self, filename, bookTags):
-		super(SpellExporter, self).__init__(filename)
+	def __init__(self, filename, bookTags, excludedBookTags=(), **kwargs):
+		super(SpellExporter, self).__init__(filename, **kwargs)
 		self.bookTags = bookTags
+		# Tags of books left out of the export; their sources are dropped rather than unknown.
+		self.excludedBookTags = excludedBookTags
+		self.excluded_sources = 0
 
 		self.name = None
 		self.names = []
@@ -117,42 +132,44 @@ class SpellExporter(SpellParser):
 		self.classes = []
 		self.info = {}
 
-	def object(self):
+	def validate(self):
 		if len(self.sources) == 0:
 			raise self.error("No sources for this spell")
 
-		object = {
-			"name": unicode(self.name, 'utf8'),
-			"names": self.names,
-			"sources": self.sources,
-			"classes": self.classes,
-			"info": self.info,
-		}
+	def parse_header(self):
+		super(SpellExporter, self).parse_header()
+		# Only in books left out of the export, so there's no need to parse the rest.
+		if len(self.sources) == 0 and self.excluded_sources > 0:
+			raise base.SkipFile()
 
-		return object
+	def export(self):
+		"""Return the parsed spell as a Spell, for keeping until it's written out."""
+		self.validate()
+
+		return Spell(
+			name=self.name,
+			names=tuple(self.names),
+			sources=tuple(self.sources),
+			classes=tuple(self.classes),
+			info=SpellInfo(**self.info))
 
 	def handle_name(self, name):
 		self.name = name
-		self.names.append(unicode(name, 'utf8'))
+		self.names.append(name)
 
 	def handle_old_name(self, name):
-		self.names.append(unicode(name, 'utf8'))
+		self.names.append(name)
 
 	def handle_source(self, source, page, section):
 		try:
 			index = self.bookTags.index(source)
 		except ValueError:
+			if source in self.excludedBookTags:
+				self.excluded_sources += 1
+				return
 			raise self.error("Unknown book tag: %s" % source)
 
-		source = {
-			"book": index,
-			"page": int(page),
-		}
-
-		if section is not None:
-			source["section"] = section
-
-		self.sources.append(source)
+		self.sources.append(base.Source(index, int(page), section))
 
 	def handle_class(self, character_class):
 		try:
@@ -200,7 +217,7 @@ class SpellExporter(SpellParser):
 
 		elif reaction is not None:
 			self.info['canCastAsReaction'] = True
-			self.info['reactionResponse'] = unicode(reaction_clause, 'utf8')
+			self.info['reactionResponse'] = reaction_clause
 
 		elif unit == 'hour' or unit == 'hours':
 			self.info['rawCastingTime'] = int(time) * 60
@@ -265,7 +282,7 @@ class SpellExporter(SpellParser):
 			self.info['hasSomaticComponent'] = True
 		if materials is not None:
 			self.info['hasMaterialComponent'] = True
-			self.info['materialComponent'] = unicode(materials, 'utf8')
+			self.info['materialComponent'] = materials
 
 	def handle_duration(self, line):
 		match = DURATION_RE.match(line)
@@ -309,4 +326,57 @@ class SpellExporter(SpellParser):
 	def handle_description(self, lines):
 		text = "\n".join(lines)
 
-		self.info['text'] = unicode(text, 'utf8')
+		self.info['text'] = text
+
+
+class SpellEntry(base.Struct):
+	__slots__ = ("name", "names", "sources", "classes", "level", "school")
+
+class SpellScanner(SpellParser):
+	"""Reads just enough of a spell to catalog it, the header, without linting or parsing the rest."""
+
+	def __init__(self, filename, **kwargs):
+		super(SpellScanner, self).__init__(filename, **kwargs)
+
+		self.name = None
+		self.names = []
+		self.sources = []
+		self.classes = []
+		self.level = None
+		self.school = None
+
+	def entry(self):
+		return SpellEntry(self.name, tuple(self.names), tuple(self.sources), tuple(self.classes),
+						  self.level, self.school)
+
+	def check_line(self, line):
+		pass
+
+	def parse(self):
+		self.parse_header()
+
+	def handle_name(self, name):
+		self.name = name
+		self.names.append(name)
+
+	def handle_old_name(self, name):
+		self.names.append(name)
+
+	def handle_source(self, source, page, section):
+		self.sources.append((source, page))
+
+	def handle_class(self, character_class):
+		self.classes.append(character_class)
+
+	def handle_level_school(self, line):
+		match = LEVEL_SCHOOL_RE.match(line)
+		if match is None:
+			raise self.error("Level/School didn't match expected format: %s" % line)
+
+		(level, school, ritual, cantrip_school) = match.groups()
+		if level is not None:
+			self.level = int(level)
+			self.school = school
+		else:
+			self.level = 0
+			self.school = cantrip_school.lower()
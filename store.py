@@ -0,0 +1,198 @@
+#!/usr/bin/env python
+# -*- coding: utf8 -*-
+
+import argparse
+import json
+import mmap
+import os
+import struct
+import sys
+
+MAGIC = "DMSTORE\0"
+FORMAT_VERSION = 1
+
+# Magic, format version, record count, index entry count, then the offsets of the key table, the index
+# and the metadata, the length of the metadata, and the content version of the export.
+HEADER_FORMAT = "<8sIIIQQQIQ"
+HEADER_SIZE = struct.calcsize(HEADER_FORMAT)
+
+# Offset and length of the key in the key table, the record type, and the offset of the record.
+INDEX_ENTRY_FORMAT = "<IHBxQ"
+INDEX_ENTRY_SIZE = struct.calcsize(INDEX_ENTRY_FORMAT)
+
+LENGTH_FORMAT = "<I"
+LENGTH_SIZE = struct.calcsize(LENGTH_FORMAT)
+
+RECORD_TYPES = [ "monster", "spell" ]
+
+def name_key(name):
+	"""Return the index key for a name; lookups ignore case."""
+	return name.lower().encode('utf8')
+
+def encode_record(object):
+	return json.dumps(object, ensure_ascii=False, sort_keys=True, separators=(",", ":")).encode('utf8')
+
+class StoreWriter(object):
+	"""Writes a record store: a fixed header, the records, then a sorted index of every name they go by.
+
+	Each record is the exported object as JSON, prefixed with its length. The index has an entry for the
+	name and each older name of every record, pointing at its offset, so a reader can binary-search it
+	and decode just the record it wants. The file must be seekable, since the header is filled in last.
+	"""
+
+	def __init__(self, file):
+		self.file = file
+		self.file.write("\0" * HEADER_SIZE)
+		self.position = HEADER_SIZE
+
+		self.count = 0
+		self.entries = []
+
+	def add(self, record_type, object):
+		# Marked with its type, as in a JSON Lines export.
+		payload = encode_record(dict(object, type=record_type))
+		offset = self.position
+		self.write(struct.pack(LENGTH_FORMAT, len(payload)) + payload)
+		self.count += 1
+
+		type_index = RECORD_TYPES.index(record_type)
+		for key in set(name_key(name) for name in object["names"]):
+			self.entries.append((key, type_index, offset))
+
+	def write(self, data):
+		self.file.write(data)
+		self.position += len(data)
+
+	def finish(self, books, version):
+		# Sorted by key, then by type and position, so all the records of a name are found together.
+		self.entries.sort()
+
+		key_table_offset = self.position
+		key_offsets = {}
+		key_position = 0
+		for key, type_index, offset in self.entries:
+			if key not in key_offsets:
+				key_offsets[key] = key_position
+				self.write(key)
+				key_position += len(key)
+
+		index_offset = self.position
+		for key, type_index, offset in self.entries:
+			self.write(struct.pack(INDEX_ENTRY_FORMAT, key_offsets[key], len(key), type_index, offset))
+
+		metadata_offset = self.position
+		metadata = encode_record({ "books": books, "version": version })
+		self.write(metadata)
+
+		self.file.seek(0)
+		self.file.write(struct.pack(HEADER_FORMAT, MAGIC, FORMAT_VERSION, self.count, len(self.entries),
+									key_table_offset, index_offset, metadata_offset, len(metadata), version))
+
+class StoreError(Exception):
+	pass
+
+class RecordStore(object):
+	"""Reads a record store written by StoreWriter, mapping it into memory rather than reading it.
+
+	Opening one only reads the header; each lookup binary-searches the index, and decodes only the
+	records with the name asked for.
+	"""
+
+	def __init__(self, path):
+		try:
+			with open(path, 'rb') as f:
+				# mmap can't map an empty file, so check it's at least big enough for the header first.
+				if os.fstat(f.fileno()).st_size < HEADER_SIZE:
+					raise StoreError("%s: Not a record store" % path)
+				self.map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+		except (IOError, OSError, mmap.error), e:
+			raise StoreError("%s: %s" % (path, e.strerror or e))
+
+		if self.map[:len(MAGIC)] != MAGIC:
+			self.close()
+			raise StoreError("%s: Not a record store" % path)
+
+		(magic, format_version, self.count, self.entry_count, self.key_table_offset, self.index_offset,
+		 metadata_offset, metadata_length, self.version) = struct.unpack_from(HEADER_FORMAT, self.map, 0)
+		if format_version != FORMAT_VERSION:
+			self.close()
+			raise StoreError("%s: Unsupported record store version %d" % (path, format_version))
+
+		self.metadata_offset = metadata_offset
+		self.metadata_length = metadata_length
+
+	def close(self):
+		self.map.close()
+
+	def __len__(self):
+		return self.count
+
+	def books(self):
+		metadata = self.map[self.metadata_offset:self.metadata_offset + self.metadata_length]
+		return json.loads(metadata)["books"]
+
+	def entry(self, index):
+		(key_offset, key_length, type_index, offset) = struct.unpack_from(
+			INDEX_ENTRY_FORMAT, self.map, self.index_offset + index * INDEX_ENTRY_SIZE)
+		start = self.key_table_offset + key_offset
+		return (self.map[start:start + key_length], type_index, offset)
+
+	def record_at(self, offset):
+		(length,) = struct.unpack_from(LENGTH_FORMAT, self.map, offset)
+		start = offset + LENGTH_SIZE
+		return json.loads(self.map[start:start + length])
+
+	def lookup(self, name, record_type=None):
+		"""Return the records going by name, or by it as an older name, optionally only those of one type."""
+		key = name_key(name)
+
+		# Find the first entry not less than key.
+		low = 0
+		high = self.entry_count
+		while low < high:
+			middle = (low + high) // 2
+			if self.entry(middle)[0] < key:
+				low = middle + 1
+			else:
+				high = middle
+
+		records = []
+		for index in xrange(low, self.entry_count):
+			(entry_key, type_index, offset) = self.entry(index)
+			if entry_key != key:
+				break
+			if record_type is None or RECORD_TYPES[type_index] == record_type:
+				records.append(self.record_at(offset))
+		return records
+
+def main():
+	argparser = argparse.ArgumentParser(description="Look up monsters and spells by name in a record store.")
+	argparser.add_argument("-t", "--type", choices=RECORD_TYPES,
+						   help="only look up records of this type")
+	argparser.add_argument("store", help="record store written by export.py --store")
+	argparser.add_argument("names", nargs="+", help="names to look up")
+	options = argparser.parse_args()
+
+	try:
+		record_store = RecordStore(options.store)
+	except StoreError, e:
+		print >>sys.stderr, e.message
+		sys.exit(1)
+
+	try:
+		missing = False
+		for name in options.names:
+			records = record_store.lookup(name.decode('utf8'), options.type)
+			if not len(records):
+				print >>sys.stderr, "%s: Not found" % name
+				missing = True
+			for record in records:
+				print encode_record(record)
+	finally:
+		record_store.close()
+
+	if missing:
+		sys.exit(1)
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,131 @@
+#!/usr/bin/env python
+# -*- coding: utf8 -*-
+
+import ctypes
+import ctypes.util
+import os
+import select
+import struct
+import time
+
+# From <sys/inotify.h>.
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+
+WATCH_MASK = IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+
+EVENT_FORMAT = "iIII"
+EVENT_SIZE = struct.calcsize(EVENT_FORMAT)
+
+def is_source_file(filename):
+	# Skip the hidden and backup files editors leave alongside while saving.
+	name = os.path.basename(filename)
+	return not name.startswith(".") and not name.endswith("~")
+
+class InotifyWatcher(object):
+	"""Watches directories with Linux inotify, through libc so nothing else needs installing."""
+
+	def __init__(self):
+		self.libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+		self.fd = self.libc.inotify_init()
+		if self.fd < 0:
+			error = ctypes.get_errno()
+			raise OSError(error, os.strerror(error))
+
+		self.directories = {}
+
+	def add(self, directory):
+		if directory in self.directories.values():
+			return
+
+		wd = self.libc.inotify_add_watch(self.fd, directory, WATCH_MASK)
+		if wd < 0:
+			error = ctypes.get_errno()
+			raise OSError(error, os.strerror(error), directory)
+		self.directories[wd] = directory
+
+	def wait(self):
+		"""Block until something changes, and return the set of paths that did."""
+		changed = set()
+		timeout = None
+		while True:
+			(readable, writable, exceptional) = select.select([ self.fd ], [], [], timeout)
+			if not len(readable):
+				return changed
+
+			data = os.read(self.fd, 65536)
+			offset = 0
+			while offset < len(data):
+				(wd, mask, cookie, length) = struct.unpack_from(EVENT_FORMAT, data, offset)
+				offset += EVENT_SIZE
+				name = data[offset:offset + length].rstrip("\0")
+				offset += length
+
+				directory = self.directories.get(wd)
+				if directory is not None and len(name):
+					changed.add(os.path.join(directory, name))
+
+			# Editors often save in a few steps, so gather up whatever follows straight after.
+			timeout = 0.01
+
+	def close(self):
+		os.close(self.fd)
+
+class PollingWatcher(object):
+	"""Watches directories by listing them and comparing modification times, where there's no inotify."""
+
+	def __init__(self, interval=0.25):
+		self.interval = interval
+		self.directories = set()
+		self.state = {}
+
+	def add(self, directory):
+		if directory in self.directories:
+			return
+
+		self.directories.add(directory)
+		self.state.update(self.scan(directory))
+
+	def scan(self, directory):
+		state = {}
+		try:
+			names = os.listdir(directory)
+		except OSError:
+			return state
+
+		for name in names:
+			path = os.path.join(directory, name)
+			try:
+				stat = os.stat(path)
+			except OSError:
+				continue
+			state[path] = (stat.st_mtime, stat.st_size)
+		return state
+
+	def wait(self):
+		"""Block until something changes, and return the set of paths that did."""
+		while True:
+			time.sleep(self.interval)
+
+			state = {}
+			for directory in self.directories:
+				state.update(self.scan(directory))
+
+			changed = set(path for path in set(state.keys()) | set(self.state.keys())
+						  if state.get(path) != self.state.get(path))
+			self.state = state
+			if len(changed):
+				return changed
+
+	def close(self):
+		pass
+
+def watcher():
+	"""Return an inotify watcher if the system has inotify, or a polling one if not."""
+	try:
+		return InotifyWatcher()
+	except (OSError, AttributeError):
+		return PollingWatcher()